@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -21,8 +22,13 @@ from app.models.rooms import Room
 from app.models.user_room import UserRoom
 from app.models.base import Base
 from app.models.messages import Message
+from app.models.room_usage import RoomUsage
 target_metadata = Base.metadata
 
+# Follow the app's DATABASE_URL override (see app/db.py)
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.getenv("DATABASE_URL"))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -0,0 +1,83 @@
+"""core tables
+
+Revision ID: 5b7e2d9c0a14
+Revises: 31a7b9c6af41
+Create Date: 2025-09-18 09:03:51.772410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e2d9c0a14'
+down_revision: Union[str, None] = '31a7b9c6af41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The first revision only created users; rooms, user_rooms and messages were
+    # created outside of Alembic on existing databases, so only add what is missing.
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+
+    if 'created_at' not in [c['name'] for c in inspector.get_columns('users')]:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.current_timestamp()))
+
+    if 'rooms' not in tables:
+        op.create_table('rooms',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('code', sa.String(length=16), nullable=False),
+        sa.Column('api_key', sa.String(length=100), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_rooms_id'), 'rooms', ['id'], unique=False)
+        op.create_index(op.f('ix_rooms_code'), 'rooms', ['code'], unique=True)
+
+    if 'user_rooms' not in tables:
+        op.create_table('user_rooms',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('role', sa.Enum('OWNER', 'PARTICIPANT', 'BOT', name='roomrole'), nullable=False),
+        sa.Column('joined_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['room_id'], ['rooms.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_user_rooms_id'), 'user_rooms', ['id'], unique=False)
+
+    if 'messages' not in tables:
+        op.create_table('messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('message_type', sa.String(), nullable=True),
+        sa.Column('processed', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['room_id'], ['rooms.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_messages_id'), 'messages', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_messages_id'), table_name='messages')
+    op.drop_table('messages')
+    op.drop_index(op.f('ix_user_rooms_id'), table_name='user_rooms')
+    op.drop_table('user_rooms')
+    op.drop_index(op.f('ix_rooms_code'), table_name='rooms')
+    op.drop_index(op.f('ix_rooms_id'), table_name='rooms')
+    op.drop_table('rooms')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('created_at')
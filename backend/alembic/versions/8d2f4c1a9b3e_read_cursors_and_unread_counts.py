@@ -0,0 +1,51 @@
+"""read cursors and unread counts
+
+Revision ID: 8d2f4c1a9b3e
+Revises: 5b7e2d9c0a14
+Create Date: 2025-09-20 10:14:05.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f4c1a9b3e'
+down_revision: Union[str, None] = '5b7e2d9c0a14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('rooms') as batch_op:
+        batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('user_rooms') as batch_op:
+        batch_op.add_column(sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'))
+
+    op.create_index('ix_messages_room_id_id', 'messages', ['room_id', 'id'], unique=False)
+
+    # Backfill: point every room at its newest message and treat existing history as read
+    op.execute(
+        "UPDATE rooms SET last_message_id = "
+        "(SELECT MAX(messages.id) FROM messages WHERE messages.room_id = rooms.id)"
+    )
+    op.execute(
+        "UPDATE user_rooms SET last_read_message_id = "
+        "(SELECT rooms.last_message_id FROM rooms WHERE rooms.id = user_rooms.room_id), "
+        "unread_count = 0"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_room_id_id', table_name='messages')
+
+    with op.batch_alter_table('user_rooms') as batch_op:
+        batch_op.drop_column('unread_count')
+        batch_op.drop_column('last_read_message_id')
+
+    with op.batch_alter_table('rooms') as batch_op:
+        batch_op.drop_column('last_message_id')
@@ -0,0 +1,69 @@
+"""compressed message content
+
+Revision ID: a7c5e2f81d40
+Revises: f3a96b18d7c2
+Create Date: 2025-10-11 09:52:13.774029
+
+"""
+from typing import Sequence, Union
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c5e2f81d40'
+down_revision: Union[str, None] = 'f3a96b18d7c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same threshold and level the app uses when this migration was written
+COMPRESS_MIN_BYTES = 1024
+ZLIB_LEVEL = 6
+BATCH_SIZE = 500
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.add_column(sa.Column('content_codec', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('content_blob', sa.LargeBinary(), nullable=True))
+
+    # Compress existing large bodies (mostly bot replies) in batches
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.text(
+                "SELECT id, content FROM messages WHERE id > :last_id AND length(content) >= :min_chars "
+                "ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "min_chars": COMPRESS_MIN_BYTES // 4, "limit": BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        for message_id, content in rows:
+            raw = content.encode("utf-8")
+            blob = zlib.compress(raw, ZLIB_LEVEL)
+            if len(raw) >= COMPRESS_MIN_BYTES and len(blob) <= len(raw) * 0.9:
+                connection.execute(
+                    sa.text("UPDATE messages SET content = '', content_codec = 'zlib', content_blob = :blob WHERE id = :id"),
+                    {"blob": blob, "id": message_id}
+                )
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text("SELECT id, content_blob FROM messages WHERE content_codec = 'zlib'")
+    ).fetchall()
+    for message_id, blob in rows:
+        connection.execute(
+            sa.text("UPDATE messages SET content = :content WHERE id = :id"),
+            {"content": zlib.decompress(blob).decode("utf-8"), "id": message_id}
+        )
+
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('content_blob')
+        batch_op.drop_column('content_codec')
@@ -0,0 +1,28 @@
+"""mark bot replies processed
+
+Revision ID: d0b3f6a2c815
+Revises: a7c5e2f81d40
+Create Date: 2025-10-14 15:08:42.331907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0b3f6a2c815'
+down_revision: Union[str, None] = 'a7c5e2f81d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Bot replies used to be saved with processed=False; they are all complete
+    op.execute("UPDATE messages SET processed = 1 WHERE message_type = 'bot' AND processed = 0")
+
+
+def downgrade() -> None:
+    # Nothing to undo: processed=True is correct for every finished bot reply
+    pass
@@ -0,0 +1,40 @@
+"""query pattern indexes
+
+Revision ID: f3a96b18d7c2
+Revises: c41e7a0d5f92
+Create Date: 2025-10-03 11:27:40.265981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a96b18d7c2'
+down_revision: Union[str, None] = 'c41e7a0d5f92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Memberships were never constrained; keep the oldest row of any duplicates
+    op.execute(
+        "DELETE FROM user_rooms WHERE id NOT IN "
+        "(SELECT MIN(id) FROM user_rooms GROUP BY user_id, room_id)"
+    )
+    # Membership checks filter on (user_id, room_id); member lists and unread updates on room_id
+    op.create_index('uq_user_rooms_user_id_room_id', 'user_rooms', ['user_id', 'room_id'], unique=True)
+    op.create_index('ix_user_rooms_room_id', 'user_rooms', ['room_id'], unique=False)
+    # Message history is read per room in created_at order
+    op.create_index('ix_messages_room_id_created_at', 'messages', ['room_id', 'created_at'], unique=False)
+    # create_room rejects duplicate names
+    op.create_index('ix_rooms_name', 'rooms', ['name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rooms_name', table_name='rooms')
+    op.drop_index('ix_messages_room_id_created_at', table_name='messages')
+    op.drop_index('ix_user_rooms_room_id', table_name='user_rooms')
+    op.drop_index('uq_user_rooms_user_id_room_id', table_name='user_rooms')
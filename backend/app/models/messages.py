@@ -1,7 +1,8 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from .base import Base
+from app.utils.compression import compress_content, decompress_content, decompress_prefix
 
 
 class Message(Base):
@@ -11,7 +12,11 @@ class Message(Base):
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
-    content = Column(Text, nullable=False)
+    # Read and write the body through `content`: large bodies are stored as a
+    # compressed blob (content_codec says how) and the content column is left empty
+    _content = Column("content", Text, nullable=False)
+    content_codec = Column(String(16), nullable=True)
+    content_blob = Column(LargeBinary, nullable=True)
     message_type = Column(String, default="text")  # could be "text", "system", "bot"
     processed = Column(Boolean, default=False, nullable=False)  # For command messages
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -19,3 +24,37 @@ class Message(Base):
     # Relationships
     user = relationship("User", back_populates="messages")
     room = relationship("Room", back_populates="messages")
+
+    @property
+    def content(self):
+        if self.content_codec is None:
+            return self._content
+        # Inflated on first access only, e.g. when the message is serialized
+        cached = self.__dict__.get("_decompressed")
+        if cached is None or cached[0] is not self.content_blob:
+            cached = (self.content_blob, decompress_content(self.content_codec, self.content_blob))
+            self.__dict__["_decompressed"] = cached
+        return cached[1]
+
+    @content.setter
+    def content(self, text):
+        self._content, self.content_codec, self.content_blob = compress_content(text)
+
+    def content_preview(self, length):
+        """The first length characters, inflating only as much of a compressed body as needed."""
+        if self.content_codec is None:
+            return self._content[:length]
+        return decompress_prefix(self.content_codec, self.content_blob, length)
+
+    @classmethod
+    def content_values(cls, text):
+        """Column values for storing text, for bulk Query.update() calls."""
+        content, codec, blob = compress_content(text)
+        return {cls._content: content, cls.content_codec: codec, cls.content_blob: blob}
+
+    __table_args__ = (
+        # Unread counts and incremental fetches are range scans on (room_id, id)
+        Index("ix_messages_room_id_id", "room_id", "id"),
+        # Message history is read per room in created_at order
+        Index("ix_messages_room_id_created_at", "room_id", "created_at"),
+    )
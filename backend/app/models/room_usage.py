@@ -0,0 +1,25 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, UniqueConstraint
+from .base import Base
+
+
+class RoomUsage(Base):
+    """Bot usage per room, API key and day. Written in batches by llm/usage.py."""
+    __tablename__ = "room_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
+    # Hash of the room's API key at the time of the calls, never the key itself
+    api_key_hash = Column(String(16), nullable=False)
+    day = Column(Date, nullable=False)
+
+    requests = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms_total = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("room_id", "api_key_hash", "day", name="uq_room_usage_room_key_day"),
+    )
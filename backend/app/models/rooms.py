@@ -7,10 +7,12 @@ class Room(Base):
 	__tablename__ = "rooms"
 
 	id = Column(Integer, primary_key=True, index=True)
-	name = Column(String(100), nullable=False)
+	name = Column(String(100), nullable=False, index=True)
 	code = Column(String(16), unique=True, nullable=False, index=True)
 	api_key = Column(String(100), nullable=False, default="123456789")
 	owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 	created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+	# Newest message in the room, kept up to date on insert so room lists don't scan messages
+	last_message_id = Column(Integer, nullable=True)
 	members = relationship("UserRoom", back_populates="room")
 	messages = relationship("Message", back_populates="room", cascade="all, delete-orphan")
\ No newline at end of file
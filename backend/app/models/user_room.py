@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum as SqlEnum
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, Enum as SqlEnum
 from sqlalchemy.orm import relationship
 from .base import Base  # assuming you have a Base in models/base.py
 
@@ -25,6 +25,19 @@ class UserRoom(Base):
     # When did this user join the room?
     joined_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    # Read cursor: id of the newest message this user has seen in the room
+    last_read_message_id = Column(Integer, nullable=True)
+
+    # Messages after the read cursor, incremented on insert and reset when the cursor moves
+    unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     # Relationships
     user = relationship("User", back_populates="rooms")
     room = relationship("Room", back_populates="members")
+
+    __table_args__ = (
+        # Membership checks filter on (user_id, room_id); a user is in a room at most once
+        Index("uq_user_rooms_user_id_room_id", "user_id", "room_id", unique=True),
+        # Member lists and unread count updates filter on room_id alone
+        Index("ix_user_rooms_room_id", "room_id"),
+    )
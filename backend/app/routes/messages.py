@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from app.models.rooms import Room
 from app.models.user_room import UserRoom, RoomRole
 from app.models.messages import Message
 from app.utils.auth_utils import get_user_id_from_token
+from app.utils.unread_utils import record_new_message, mark_room_read
 from app.db import get_db
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from llm.llm_queue import enqueue_bot_job
+from llm.llm_queue import enqueue_bot_job, cancel_bot_job, active_jobs
+from llm.inflight import inflight_bot_message_ids
+from llm.usage import check_quota, hash_api_key
+from app.utils.profiling import stage
+from app.utils.traffic import annotate
+from app.utils.rate_limit import enforce, user_send_limiter, room_send_limiter, user_bot_limiter, api_key_bot_limiter
 import uuid
 from datetime import datetime
 router = APIRouter()
@@ -24,6 +30,7 @@ class SendMessageResponse(BaseModel):
     content: str
     message_type: str  # "text", "command", "bot"
     sent_at: datetime
+    generating: bool = False  # a bot reply saved part-way that is still being streamed
 
 class GetMessagesRequest(BaseModel):
     room_code: str
@@ -31,6 +38,18 @@ class GetMessagesRequest(BaseModel):
 class GetMessagesResponse(BaseModel):
     messages: list[SendMessageResponse]
 
+class CancelBotResponse(BaseModel):
+    message_id: int
+    cancelled: bool
+
+class MarkReadRequest(BaseModel):
+    message_id: int | None = None  # defaults to the newest message in the room
+
+class MarkReadResponse(BaseModel):
+    room_code: str
+    last_read_message_id: int | None
+    unread_count: int
+
 @router.post("/room/{room_code}/send_message", response_model=SendMessageResponse)
 async def send_message(room_code: str, message: SendMessageRequest, db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
     user_id = get_user_id_from_token(credentials.credentials)
@@ -44,6 +63,16 @@ async def send_message(room_code: str, message: SendMessageRequest, db: Session
     # if the message content has "@bot", set message_type to "command"
     if "@bot" in message.content:
         message_type = "command"        
+    if message_type == "command":
+        quota = check_quota(db, room.id, room.api_key)
+        if quota is not None:
+            raise HTTPException(status_code=429, detail=f"Bot usage quota exceeded ({quota})")
+    # Admission control last, so requests rejected above don't spend tokens;
+    # bot commands also spend from the bot limiters
+    limits = [(user_send_limiter, user_id), (room_send_limiter, room.id)]
+    if message_type == "command":
+        limits += [(user_bot_limiter, user_id), (api_key_bot_limiter, hash_api_key(room.api_key))]
+    enforce(*limits)
     new_message = Message(
         room_id=room.id,
         user_id=user_id,
@@ -52,12 +81,15 @@ async def send_message(room_code: str, message: SendMessageRequest, db: Session
         created_at=created_at
     )
     db.add(new_message)
+    db.flush()
+    record_new_message(db, new_message)
     db.commit()
     db.refresh(new_message)
+    annotate(chars=len(message.content), command=message_type == "command", msg=new_message.id)
 
     # If this is a command message, enqueue it for bot processing
     if message_type == "command":
-        await enqueue_bot_job(room.id, new_message.id, message.content, room.api_key)
+        await enqueue_bot_job(room.id, new_message.id, message.content, room.api_key, user_id)
 
     return SendMessageResponse(
         message_id=new_message.id,
@@ -69,22 +101,71 @@ async def send_message(room_code: str, message: SendMessageRequest, db: Session
     )
 
 @router.get("/room/{room_code}/messages", response_model=GetMessagesResponse)
-async def get_messages(room_code: str, db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+async def get_messages(room_code: str, after_id: int | None = None, db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
     user_id = get_user_id_from_token(credentials.credentials)
     room = db.query(Room).filter(Room.code == room_code).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     if not db.query(UserRoom).filter(UserRoom.room_id == room.id, UserRoom.user_id == user_id).first():
         raise HTTPException(status_code=403, detail="User not in room")
-    messages = db.query(Message).filter(Message.room_id == room.id).order_by(Message.created_at).all()
-    response_messages = [
-        SendMessageResponse(
-            message_id=msg.id,
-            room_code=room.code,
-            user_id=msg.user_id,
-            content=msg.content,
-            message_type=msg.message_type,
-            sent_at=msg.created_at
-        ) for msg in messages
-    ]
-    return GetMessagesResponse(messages=response_messages)
\ No newline at end of file
+    query = db.query(Message).filter(Message.room_id == room.id)
+    if after_id is not None:
+        # Incremental fetch: only messages newer than what the client already has
+        query = query.filter(Message.id > after_id)
+    messages = query.order_by(Message.created_at).all()
+    inflight_ids = set(inflight_bot_message_ids(room.id))
+    # Encode here rather than letting FastAPI do it after the handler returns,
+    # so the stage covers building the models and the JSON encoding
+    with stage("serialization"):
+        response_messages = [
+            SendMessageResponse(
+                message_id=msg.id,
+                room_code=room.code,
+                user_id=msg.user_id,
+                content=msg.content,
+                message_type=msg.message_type,
+                sent_at=msg.created_at,
+                generating=msg.id in inflight_ids
+            ) for msg in messages
+        ]
+        body = GetMessagesResponse(messages=response_messages).model_dump_json()
+    return Response(content=body, media_type="application/json")
+
+@router.post("/room/{room_code}/read", response_model=MarkReadResponse)
+async def mark_read(room_code: str, request: MarkReadRequest, db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+    user_id = get_user_id_from_token(credentials.credentials)
+    room = db.query(Room).filter(Room.code == room_code).first()
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    membership = db.query(UserRoom).filter(UserRoom.room_id == room.id, UserRoom.user_id == user_id).first()
+    if not membership:
+        raise HTTPException(status_code=403, detail="User not in room")
+    if request.message_id is not None and not db.query(Message.id).filter(
+        Message.id == request.message_id, Message.room_id == room.id
+    ).first():
+        raise HTTPException(status_code=404, detail="Message not found in this room")
+    mark_room_read(db, membership, request.message_id, room.last_message_id)
+    db.commit()
+    return MarkReadResponse(
+        room_code=room.code,
+        last_read_message_id=membership.last_read_message_id,
+        unread_count=membership.unread_count
+    )
+
+@router.post("/room/{room_code}/bot/{message_id}/cancel", response_model=CancelBotResponse)
+async def cancel_bot_reply(room_code: str, message_id: int, db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+    user_id = get_user_id_from_token(credentials.credentials)
+    room = db.query(Room).filter(Room.code == room_code).first()
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    membership = db.query(UserRoom).filter(UserRoom.room_id == room.id, UserRoom.user_id == user_id).first()
+    if not membership:
+        raise HTTPException(status_code=403, detail="User not in room")
+    job = active_jobs.get(message_id)
+    if not job or job.room_id != room.id:
+        raise HTTPException(status_code=404, detail="No bot reply in progress for this message")
+    # Only the user who asked, or the room owner, may stop a reply
+    if job.user_id != user_id and room.owner_id != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to cancel this bot reply")
+    cancel_bot_job(message_id, "requested")
+    return CancelBotResponse(message_id=message_id, cancelled=True)
@@ -7,12 +7,16 @@ from app.models.messages import Message
 from app.utils.auth_utils import get_user_id_from_token
 from app.db import get_db
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from llm.inflight import get_room_snapshots, inflight_bot_message_ids
+from app.utils.rate_limit import acquire, ws_connect_limiter
+from app.utils.traffic import record_event, trace_offset
+from app.utils.compression import Frame, send_frame
 import asyncio
 
 router = APIRouter()
 bearer_scheme = HTTPBearer()
 
-# Track active connections
+# Track active connections, keyed by room id
 active_connections = {}
 
 @router.websocket("/ws")
@@ -54,6 +58,10 @@ async def room_websocket(websocket: WebSocket, room_code: str):
         await websocket.close(code=1008)
         return
 
+    # Reject reconnect storms before touching the DB (1013: try again later)
+    if acquire((ws_connect_limiter, user_id)) is not None:
+        await websocket.close(code=1013)
+        return
 
     # Find the room by code
     db: Session = next(get_db())
@@ -69,45 +77,73 @@ async def room_websocket(websocket: WebSocket, room_code: str):
         return
 
     await websocket.accept()
+    connected_t = trace_offset()
+    connected_at = asyncio.get_running_loop().time()
     
     # Track this connection in the room
-    if room_code not in active_connections:
-        active_connections[room_code] = []
-    active_connections[room_code].append(websocket)
+    if room.id not in active_connections:
+        active_connections[room.id] = []
+    active_connections[room.id].append(websocket)
     
     try:
         # Send welcome message
-        await websocket.send_json({"msg": f"Connected to room {room_code}"})
+        await send_frame(websocket, {"msg": f"Connected to room {room_code}"})
+
+        # Catch up on bot replies that are still being generated; live deltas
+        # follow with offsets so the client can drop anything already in the snapshot
+        for snapshot in get_room_snapshots(room.id):
+            await send_frame(websocket, snapshot)
         
         # Keep connection open and handle messages
         while True:
             # Continuously poll for new messages in the room
             last_message_id = None
+            sent_ids = set()  # ids above last_message_id that have already been broadcast
             while True:
                 # Check for new messages in the database
                 db: Session = next(get_db())
                 query = db.query(Message).filter_by(room_id=room.id)
-                if last_message_id:
+                # Bot replies still being streamed are delivered through the bot_message_* events
+                inflight_ids = inflight_bot_message_ids(room.id)
+                if inflight_ids:
+                    query = query.filter(Message.id.notin_(inflight_ids))
+                if last_message_id is not None:
                     query = query.filter(Message.id > last_message_id)
-                new_messages = query.order_by(Message.id.asc()).all()
+                new_messages = [msg for msg in query.order_by(Message.id.asc()).all() if msg.id not in sent_ids]
 
                 if new_messages:
                     for msg in new_messages:
-                        # Broadcast new message to all clients in this room
-                        for connection in active_connections[room_code]:
-                            await connection.send_json({
-                                "room": room_code,
-                                "message": msg.content,
-                                "sender_id": msg.user_id,
-                                "timestamp": msg.created_at.isoformat() if msg.created_at else None
-                            })
-                    last_message_id = new_messages[-1].id
+                        # Broadcast new message to all clients in this room, encoded once
+                        frame = Frame({
+                            "room": room_code,
+                            "message": msg.content,
+                            "sender_id": msg.user_id,
+                            "timestamp": msg.created_at.isoformat() if msg.created_at else None
+                        })
+                        for connection in active_connections[room.id]:
+                            await send_frame(connection, frame)
+                        sent_ids.add(msg.id)
+                    # Keep the cursor below replies still being generated so they're
+                    # picked up once finished, even if newer messages were sent meanwhile
+                    last_message_id = max(sent_ids)
+                    if inflight_ids:
+                        last_message_id = min(last_message_id, min(inflight_ids) - 1)
+                    sent_ids = {message_id for message_id in sent_ids if message_id > last_message_id}
 
                 # Sleep briefly to avoid hammering the DB
                 await asyncio.sleep(1)
                 
     except WebSocketDisconnect:
         # Remove this connection when client disconnects
-        active_connections[room_code].remove(websocket)
-        if not active_connections[room_code]:
-            del active_connections[room_code]
+        if websocket in active_connections.get(room.id, []):
+            active_connections[room.id].remove(websocket)
+        if room.id in active_connections and not active_connections[room.id]:
+            del active_connections[room.id]
+    finally:
+        record_event(
+            "ws",
+            t=connected_t,
+            room=room_code,
+            user=user_id,
+            duration_s=round(asyncio.get_running_loop().time() - connected_at, 3)
+        )
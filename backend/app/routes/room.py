@@ -2,13 +2,18 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.models.rooms import Room
 from app.models.user_room import UserRoom, RoomRole
+from app.models.messages import Message
+from app.models.room_usage import RoomUsage
+from llm.usage import hash_api_key, pending_usage, COUNTER_FIELDS
 from app.utils.auth_utils import get_user_id_from_token
 from app.utils.bot_utils import get_or_create_bot_user
+from app.utils.traffic import annotate
 from app.db import get_db
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import uuid
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, date
 router = APIRouter()
 bearer_scheme = HTTPBearer()
 
@@ -46,6 +51,40 @@ class JoinRoomResponse(BaseModel):
     room_code: str
     joined_at: datetime
 
+class LastMessagePreview(BaseModel):
+    message_id: int
+    user_id: int
+    content: str
+    message_type: str
+    sent_at: datetime
+
+class MyRoomResponse(BaseModel):
+    room_id: int
+    room_name: str
+    room_code: str
+    role: str
+    users: list[RoomUser]
+    last_message: LastMessagePreview | None
+    last_read_message_id: int | None
+    unread_count: int
+
+class RoomUsageDay(BaseModel):
+    day: date
+    api_key_hash: str
+    requests: int
+    errors: int
+    prompt_tokens: int
+    completion_tokens: int
+    avg_latency_ms: float
+
+class RoomUsageResponse(BaseModel):
+    room_code: str
+    current_api_key_hash: str
+    usage: list[RoomUsageDay]
+
+# Length of the last message preview returned by /rooms/my_rooms
+PREVIEW_LENGTH = 120
+
 
 
 @router.post("/create_room", response_model=RoomCreateResponse)
@@ -65,18 +104,64 @@ async def create_room(request: RoomCreateRequest, db: Session = Depends(get_db),
     db.refresh(new_room)
 
     # Add creator to user_rooms table as owner
-    creator_user_room = UserRoom(user_id=user_id, room_id=new_room.id, role=RoomRole.OWNER)
+    creator_user_room = UserRoom(user_id=user_id, room_id=new_room.id, role=RoomRole.OWNER, unread_count=0)
     db.add(creator_user_room)
     
     # Add bot to the room automatically
     bot_user_id = get_or_create_bot_user(db)
-    bot_user_room = UserRoom(user_id=bot_user_id, room_id=new_room.id, role=RoomRole.BOT)
+    bot_user_room = UserRoom(user_id=bot_user_id, room_id=new_room.id, role=RoomRole.BOT, unread_count=0)
     db.add(bot_user_room)
     
     db.commit()
+    annotate(room=new_room.code)
 
     return {"room_id": new_room.id, "room_name": new_room.name, "room_code": new_room.code}
 
+# Declared before /rooms/{room_code} so "my_rooms" isn't taken as a room code
+@router.get("/rooms/my_rooms", response_model=list[MyRoomResponse])
+async def get_my_rooms(db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+    user_id = get_user_id_from_token(credentials.credentials)
+    # One query for memberships, rooms and each room's last message (via the denormalized pointer)
+    rows = (
+        db.query(UserRoom, Room, Message)
+        .join(Room, Room.id == UserRoom.room_id)
+        .outerjoin(Message, Message.id == Room.last_message_id)
+        .filter(UserRoom.user_id == user_id)
+        .order_by(Room.last_message_id.desc(), Room.id.desc())
+        .all()
+    )
+    if not rows:
+        return []
+
+    # One more query for the members of all those rooms
+    room_ids = [room.id for _, room, _ in rows]
+    members = defaultdict(list)
+    for ur in db.query(UserRoom).filter(UserRoom.room_id.in_(room_ids)).all():
+        members[ur.room_id].append(RoomUser(user_id=ur.user_id, role=ur.role.value if hasattr(ur.role, 'value') else ur.role))
+
+    result = []
+    for membership, room, last_message in rows:
+        preview = None
+        if last_message:
+            preview = LastMessagePreview(
+                message_id=last_message.id,
+                user_id=last_message.user_id,
+                content=last_message.content_preview(PREVIEW_LENGTH),
+                message_type=last_message.message_type,
+                sent_at=last_message.created_at
+            )
+        result.append(MyRoomResponse(
+            room_id=room.id,
+            room_name=room.name,
+            room_code=room.code,
+            role=membership.role.value if hasattr(membership.role, 'value') else membership.role,
+            users=members[room.id],
+            last_message=preview,
+            last_read_message_id=membership.last_read_message_id,
+            unread_count=membership.unread_count or 0
+        ))
+    return result
+
 @router.get("/rooms/{room_code}", response_model=RoomResponse)
 async def get_room(room_code: str, db: Session = Depends(get_db)):
     room = db.query(Room).filter(Room.code == room_code).first()
@@ -105,17 +190,55 @@ async def join_room(room_code: str, db: Session = Depends(get_db), credentials:
         return {"room_name": room.name, "room_code": room.code, "joined_at": existing_membership.joined_at}
     
     # Add user to room as participant
-    new_membership = UserRoom(user_id=user_id, room_id=room.id, role=RoomRole.PARTICIPANT)
+    # History from before joining doesn't count as unread
+    new_membership = UserRoom(user_id=user_id, room_id=room.id, role=RoomRole.PARTICIPANT,
+                              last_read_message_id=room.last_message_id, unread_count=0)
     db.add(new_membership)
     
     # Ensure bot is also in the room (for rooms created before bot auto-join feature)
     bot_user_id = get_or_create_bot_user(db)
     bot_membership = db.query(UserRoom).filter(UserRoom.user_id == bot_user_id, UserRoom.room_id == room.id).first()
     if not bot_membership:
-        bot_user_room = UserRoom(user_id=bot_user_id, room_id=room.id, role=RoomRole.BOT)
+        bot_user_room = UserRoom(user_id=bot_user_id, room_id=room.id, role=RoomRole.BOT,
+                                 last_read_message_id=room.last_message_id, unread_count=0)
         db.add(bot_user_room)
     
     db.commit()
     db.refresh(new_membership)
 
-    return {"room_name": room.name, "room_code": room.code, "joined_at": new_membership.joined_at}
\ No newline at end of file
+    return {"room_name": room.name, "room_code": room.code, "joined_at": new_membership.joined_at}
+
+@router.get("/rooms/{room_code}/usage", response_model=RoomUsageResponse)
+async def get_room_usage(room_code: str, db: Session = Depends(get_db), credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+    user_id = get_user_id_from_token(credentials.credentials)
+    room = db.query(Room).filter(Room.code == room_code).first()
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    # Usage reveals how the room's API key is spent, so only the owner may see it
+    if room.owner_id != user_id:
+        raise HTTPException(status_code=403, detail="Only the room owner can view usage")
+
+    # Flushed rows plus whatever is still buffered in memory
+    totals = {}
+    for row in db.query(RoomUsage).filter(RoomUsage.room_id == room.id).all():
+        totals[(row.api_key_hash, row.day)] = {field: getattr(row, field) for field in COUNTER_FIELDS}
+    for (room_id, api_key_hash, day), counters in pending_usage.items():
+        if room_id != room.id:
+            continue
+        merged = totals.setdefault((api_key_hash, day), dict.fromkeys(COUNTER_FIELDS, 0))
+        for field in COUNTER_FIELDS:
+            merged[field] += counters[field]
+
+    usage = [
+        RoomUsageDay(
+            day=day,
+            api_key_hash=api_key_hash,
+            requests=counters["requests"],
+            errors=counters["errors"],
+            prompt_tokens=counters["prompt_tokens"],
+            completion_tokens=counters["completion_tokens"],
+            avg_latency_ms=counters["latency_ms_total"] / counters["requests"] if counters["requests"] else 0.0
+        )
+        for (api_key_hash, day), counters in sorted(totals.items(), key=lambda item: item[0][1], reverse=True)
+    ]
+    return RoomUsageResponse(room_code=room.code, current_api_key_hash=hash_api_key(room.api_key), usage=usage)
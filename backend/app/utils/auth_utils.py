@@ -1,18 +1,26 @@
-from passlib.context import CryptContext
 import jwt
 from datetime import datetime, timedelta
+from app.utils.profiling import stage
 
 SECRET_KEY = "your-secret-key"  # Change this in production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Created on first use: importing passlib/bcrypt is slow and most requests only need JWTs
+pwd_context = None
+
+def get_pwd_context():
+    global pwd_context
+    if pwd_context is None:
+        from passlib.context import CryptContext
+        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return pwd_context
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -23,7 +31,8 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 def get_user_id_from_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with stage("auth"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         # print("Decoded JWT payload:", payload)
         user_id = payload.get("sub")
         # print("Extracted user_id (sub):", user_id)
@@ -1,13 +1,23 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from app.utils.auth_utils import hash_password
 from datetime import datetime
 
+# Resolved once (at startup or on first use) and reused; the bot user is never deleted
+_bot_user_id = None
+
 def get_or_create_bot_user(db: Session) -> int:
     """
     Get or create the system bot user.
     Returns the bot user ID.
     """
+    global _bot_user_id
+    if _bot_user_id is None:
+        _bot_user_id = _get_or_create_bot_user(db)
+    return _bot_user_id
+
+def _get_or_create_bot_user(db: Session) -> int:
     bot_username = "system_bot"
     
     # Try to find existing bot user
@@ -23,10 +33,15 @@ def get_or_create_bot_user(db: Session) -> int:
     hashed_pw = hash_password("bot_password_never_used")
     created_at = datetime.utcnow()
     
-    result = db.execute(
-        text("INSERT INTO users (username, hashed_password, created_at) VALUES (:username, :password, :created_at)"),
-        {"username": bot_username, "password": hashed_pw, "created_at": created_at}
-    )
+    try:
+        # Savepoint so losing the race doesn't roll back the caller's pending work
+        with db.begin_nested():
+            db.execute(
+                text("INSERT INTO users (username, hashed_password, created_at) VALUES (:username, :password, :created_at)"),
+                {"username": bot_username, "password": hashed_pw, "created_at": created_at}
+            )
+    except IntegrityError:
+        pass  # Created concurrently (e.g. by startup warmup); use that one
     db.commit()
     
     # Get the newly created user ID
@@ -0,0 +1,74 @@
+import json
+import os
+import zlib
+
+# Message bodies at least this many UTF-8 bytes are stored zlib-compressed
+MESSAGE_COMPRESS_MIN_BYTES = int(os.getenv("MESSAGE_COMPRESS_MIN_BYTES", "1024"))
+
+# Websocket frames at least this long are sent compressed to clients that asked for it
+WS_COMPRESS_MIN_BYTES = int(os.getenv("WS_COMPRESS_MIN_BYTES", "2048"))
+
+ZLIB_LEVEL = 6
+
+# Keep the plain text unless compression saves at least this fraction
+MIN_SAVINGS = 0.1
+
+
+def compress_content(text):
+    """
+    Encode a message body for storage: (content, codec, blob). Short or
+    incompressible bodies stay as text with no codec; others are stored as a
+    zlib blob with an empty content column.
+    """
+    raw = text.encode("utf-8")
+    if len(raw) < MESSAGE_COMPRESS_MIN_BYTES:
+        return text, None, None
+    blob = zlib.compress(raw, ZLIB_LEVEL)
+    if len(blob) > len(raw) * (1 - MIN_SAVINGS):
+        return text, None, None
+    return "", "zlib", blob
+
+
+def decompress_content(codec, blob):
+    if codec == "zlib":
+        return zlib.decompress(blob).decode("utf-8")
+    raise ValueError(f"Unknown content codec: {codec}")
+
+
+def decompress_prefix(codec, blob, length):
+    """The first length characters of a stored body, without inflating the rest."""
+    if codec == "zlib":
+        # A character is at most 4 UTF-8 bytes; a character cut in half is dropped
+        raw = zlib.decompressobj().decompress(blob, length * 4)
+        return raw.decode("utf-8", errors="ignore")[:length]
+    raise ValueError(f"Unknown content codec: {codec}")
+
+
+class Frame:
+    """A websocket message encoded once for all recipients; compressed on first need."""
+    def __init__(self, message):
+        # Same encoding as WebSocket.send_json
+        self.text = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        self._compressed = None
+
+    def compressed(self):
+        if self._compressed is None:
+            self._compressed = zlib.compress(self.text.encode("utf-8"), ZLIB_LEVEL)
+        return self._compressed
+
+
+def wants_compression(websocket):
+    # Clients opt in with ?compress=zlib and must then accept binary frames
+    return websocket.query_params.get("compress") == "zlib"
+
+
+async def send_frame(websocket, message):
+    """
+    send_json() that sends large frames as zlib-compressed binary to clients
+    that opted in. Pass a Frame to encode a broadcast only once.
+    """
+    frame = message if isinstance(message, Frame) else Frame(message)
+    if len(frame.text) >= WS_COMPRESS_MIN_BYTES and wants_compression(websocket):
+        await websocket.send_bytes(frame.compressed())
+    else:
+        await websocket.send_text(frame.text)
@@ -0,0 +1,238 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event
+
+# Fraction of HTTP requests and bot jobs to profile; 0 turns profiling off
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# Sampled requests slower than this are written to PROFILE_DIR
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+# Bot jobs stream from the model for seconds, so they get their own threshold
+PROFILE_SLOW_JOB_MS = float(os.getenv("PROFILE_SLOW_JOB_MS", "20000"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+
+# How often the stack sampler looks at the event loop thread while a profile is active
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    """
+    Timings for one sampled request or bot job: wall time per stage (auth,
+    db, serialization, fanout, llm, ...) plus stack samples, in collapsed
+    "frame;frame;frame count" form, of the threads it ran on: the event loop
+    and, for sync routes, the threadpool thread that entered a stage.
+
+    Stages are inclusive and may overlap (a db query inside serialization
+    counts towards both). Stack samples show whatever those threads were
+    running, which under concurrency includes other requests.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.stages = Counter()
+        self.stage_calls = Counter()
+        self.samples = Counter()
+        self.thread_ids = {threading.get_ident()}
+
+    def add_stage(self, name, seconds):
+        self.stages[name] += seconds
+        self.stage_calls[name] += 1
+
+    def folded_stages(self):
+        # Stage breakdown as flamegraph input too, in microseconds
+        lines = [f"{self.name};{stage} {int(seconds * 1e6)}" for stage, seconds in self.stages.items()]
+        other = self.duration - sum(self.stages.values())
+        if other > 0:
+            lines.append(f"{self.name};other {int(other * 1e6)}")
+        return lines
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            "stage_calls": dict(self.stage_calls),
+            "samples": sum(self.samples.values()),
+            "sample_interval_ms": PROFILE_INTERVAL_SECONDS * 1000,
+        }
+
+
+class StackSampler:
+    """Background thread that samples the stacks of threads running active profiles."""
+    def __init__(self):
+        self.active = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, profile):
+        with self.lock:
+            self.active.add(profile)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self.thread.start()
+
+    def remove(self, profile):
+        with self.lock:
+            self.active.discard(profile)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                profiles = list(self.active)
+                if not profiles:
+                    self.thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                for thread_id in list(profile.thread_ids):
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.samples[fold_stack(frame)] += 1
+            time.sleep(PROFILE_INTERVAL_SECONDS)
+
+
+def fold_stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+sampler = StackSampler()
+
+
+def should_profile():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profile_request(name, force=False, slow_ms=None):
+    """
+    Profile the enclosed block if it's sampled (or force is set); yields the
+    profile or None. It's dumped if it took at least slow_ms (default PROFILE_SLOW_MS).
+    """
+    if current_profile.get() is not None or not (force or should_profile()):
+        yield None
+        return
+    profile = RequestProfile(name)
+    token = current_profile.set(profile)
+    sampler.add(profile)
+    try:
+        yield profile
+    finally:
+        sampler.remove(profile)
+        current_profile.reset(token)
+        profile.duration = time.perf_counter() - profile.start
+        if profile.duration * 1000 >= (PROFILE_SLOW_MS if slow_ms is None else slow_ms):
+            dump_profile_in_background(profile)
+
+
+@contextmanager
+def stage(name):
+    """Attribute the enclosed block's wall time to a stage of the current profile, if any."""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.thread_ids.add(threading.get_ident())
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, time.perf_counter() - started)
+
+
+async def timed_stream(stream, stage_name):
+    """Yield from an async iterator, counting the time spent waiting on it as a stage."""
+    iterator = stream.__aiter__()
+    try:
+        while True:
+            with stage(stage_name):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        # Closing the wrapper closes the wrapped stream too
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+def dump_profile(profile):
+    """
+    Write <name>.folded (stack samples and the stage breakdown, ready for
+    flamegraph.pl or speedscope) and <name>.json (stage timings).
+    """
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", profile.name).strip("_")
+        base = os.path.join(
+            PROFILE_DIR,
+            f"{profile.started_at.strftime('%Y%m%dT%H%M%S.%f')}_{slug}_{int(profile.duration * 1000)}ms"
+        )
+        with open(base + ".folded", "w") as f:
+            for stack, count in profile.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(base + ".stages.folded", "w") as f:
+            f.write("\n".join(profile.folded_stages()) + "\n")
+        with open(base + ".json", "w") as f:
+            json.dump(profile.summary(), f, indent=2)
+        print(f"Slow {profile.name} ({int(profile.duration * 1000)} ms), profile written to {base}.*")
+    except OSError as e:
+        print(f"Could not write profile for {profile.name}: {e}")
+
+
+def dump_profile_in_background(profile):
+    # On the event loop, write from the default executor so slow disks don't stall other requests
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        dump_profile(profile)
+        return
+    loop.run_in_executor(None, dump_profile, profile)
+
+
+async def profile_http_requests(request, call_next):
+    """HTTP middleware: profile a sample of requests, named by method and route template."""
+    with profile_request(f"{request.method} {request.url.path}") as profile:
+        response = await call_next(request)
+        if profile is not None:
+            route = request.scope.get("route")
+            if route is not None:
+                profile.name = f"{request.method} {route.path}"
+        return response
+
+
+def instrument_engine(engine):
+    """Count time spent in SQL statements as the "db" stage."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.thread_ids.add(threading.get_ident())
+            context._profile_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        started = getattr(context, "_profile_started", None)
+        if profile is not None and started is not None:
+            profile.add_stage("db", time.perf_counter() - started)
@@ -0,0 +1,73 @@
+import re
+from sqlalchemy import event
+
+# "SCAN messages" (or "SCAN TABLE messages" on older SQLite) is a full table scan;
+# "SCAN messages USING INDEX ..." walks an index instead
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)")
+
+# Plan lines that look like scans but aren't of a table
+NOT_TABLES = {"CONSTANT", "SUBQUERY"}
+
+AUDITED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "INSERT")
+
+
+class QueryPlanAudit:
+    """
+    Capture every statement run on an engine and check SQLite's query plan
+    for full table scans.
+
+        with QueryPlanAudit(engine) as audit:
+            ...exercise routes / the bot worker...
+        audit.assert_no_full_scans()
+
+    Tables in allow_scans (e.g. ones that always hold a handful of rows) are
+    not reported.
+    """
+    def __init__(self, engine, allow_scans=()):
+        self.engine = engine
+        self.allow_scans = set(allow_scans)
+        self.statements = {}  # statement -> (parameters of the first call, number of calls)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._capture)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._capture)
+        return False
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(AUDITED_STATEMENTS):
+            return
+        # Real executemany calls pass a list of rows; explain the first one
+        if executemany and parameters and isinstance(parameters[0], (tuple, list, dict)):
+            parameters = parameters[0]
+        first_parameters, calls = self.statements.get(statement, (parameters, 0))
+        self.statements[statement] = (first_parameters, calls + 1)
+
+    def plans(self):
+        """(statement, calls, [plan detail lines]) for every captured statement."""
+        results = []
+        with self.engine.connect() as connection:
+            for statement, (parameters, calls) in self.statements.items():
+                if not isinstance(parameters, dict):
+                    parameters = tuple(parameters)
+                rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+                results.append((statement, calls, [row[-1] for row in rows]))
+        return results
+
+    def full_scans(self):
+        """(statement, plan detail) for every full table scan outside allow_scans."""
+        scans = []
+        for statement, calls, details in self.plans():
+            for detail in details:
+                match = FULL_SCAN.match(detail)
+                if match and match.group(1) not in self.allow_scans | NOT_TABLES:
+                    scans.append((statement, detail))
+        return scans
+
+    def assert_no_full_scans(self):
+        scans = self.full_scans()
+        if scans:
+            report = "\n\n".join(f"{detail}\n  {' '.join(statement.split())}" for statement, detail in scans)
+            raise AssertionError(f"{len(scans)} full table scan(s):\n\n{report}")
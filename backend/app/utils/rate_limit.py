@@ -0,0 +1,101 @@
+import math
+import time
+from collections import OrderedDict
+from fastapi import HTTPException
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by user, room, API key, ...: each key may spend up to
+    `burst` tokens at once, refilled at `rate` tokens per second.
+
+    Buckets are kept in least-recently-used order and capped at max_buckets.
+    A bucket that has been idle long enough to refill completely is the same
+    as a new one, so those are dropped first without changing any decision.
+    """
+    def __init__(self, name, rate, burst, max_buckets=10000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self.refill_seconds = burst / rate
+        self.buckets = OrderedDict()  # key -> [tokens, last_update]
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def _bucket(self, key, now):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [self.burst, now]
+            self._evict(now)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self, now):
+        while self.buckets:
+            key, (tokens, updated) = next(iter(self.buckets.items()))
+            if len(self.buckets) <= self.max_buckets and now - updated < self.refill_seconds:
+                break
+            del self.buckets[key]
+            self.evicted += 1
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "buckets": len(self.buckets),
+        }
+
+
+def acquire(*checks, cost=1):
+    """
+    Take cost tokens from every (limiter, key) in checks, or from none of them.
+    Returns None on success, otherwise (limiter, seconds until it would allow).
+    """
+    now = time.monotonic()
+    buckets = [(limiter, limiter._bucket(key, now)) for limiter, key in checks]
+    for limiter, bucket in buckets:
+        if bucket[0] < cost:
+            limiter.rejected += 1
+            return limiter, (cost - bucket[0]) / limiter.rate
+    for limiter, bucket in buckets:
+        bucket[0] -= cost
+        limiter.allowed += 1
+    return None
+
+
+def enforce(*checks, cost=1):
+    """acquire() for HTTP routes: raise 429 with Retry-After when a limit is hit."""
+    denied = acquire(*checks, cost=cost)
+    if denied is not None:
+        limiter, wait = denied
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded ({limiter.name})",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))}
+        )
+
+
+# Messages: 5 per second sustained, bursts of 20, per user and per room
+user_send_limiter = RateLimiter("user_send", rate=5, burst=20)
+room_send_limiter = RateLimiter("room_send", rate=20, burst=60)
+
+# @bot commands cost an LLM call: 1 every 6 seconds per user, 1 per second per API key
+user_bot_limiter = RateLimiter("user_bot", rate=1 / 6, burst=5)
+api_key_bot_limiter = RateLimiter("api_key_bot", rate=1, burst=10)
+
+# Websocket (re)connects per user
+ws_connect_limiter = RateLimiter("ws_connect", rate=1, burst=10)
+
+LIMITERS = [user_send_limiter, room_send_limiter, user_bot_limiter, api_key_bot_limiter, ws_connect_limiter]
+
+
+def limiter_stats():
+    return {limiter.name: limiter.stats() for limiter in LIMITERS}
@@ -0,0 +1,184 @@
+import contextvars
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from app.utils.auth_utils import get_user_id_from_token
+
+# Set to a file path (".gz" for gzip) to record anonymized traffic traces for replay_traffic.py
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH")
+
+# Buffered events are appended to the file in batches of this size (and at shutdown)
+TRAFFIC_FLUSH_EVERY = 200
+
+# Identifiers that are replaced by salted hashes before anything is written
+ANONYMIZED_FIELDS = ("room", "user", "msg")
+
+# Extra fields a route adds to the event of the HTTP request it is serving
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class TrafficRecorder:
+    """
+    Append-only trace of HTTP requests, websocket sessions and bot jobs, one
+    compact JSON object per line. "t" is seconds since recording started.
+
+    Rooms, users and message ids are hashed with a salt that is never written
+    out, so a trace links events of the same room/user but can't be mapped
+    back to them. Message content is never recorded, only its size.
+    """
+    def __init__(self, path, salt=None):
+        self.path = path
+        self.salt = salt or os.urandom(16)
+        self.start = time.monotonic()
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.recorded = 0
+        # Gzip and file I/O happen here, off the event loop; one thread keeps batches in order
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="traffic-writer")
+        self.buffer.append(json.dumps({
+            "kind": "header",
+            "version": 1,
+            "started_at": datetime.utcnow().isoformat()
+        }))
+
+    def anonymize(self, field, value):
+        if value is None:
+            return None
+        # Namespaced so that e.g. user 5 and message 5 don't share a hash
+        return hmac.new(self.salt, f"{field}:{value}".encode(), hashlib.sha256).hexdigest()[:12]
+
+    def offset(self):
+        return round(time.monotonic() - self.start, 4)
+
+    def record(self, kind, **fields):
+        for field in ANONYMIZED_FIELDS:
+            if field in fields:
+                fields[field] = self.anonymize(field, fields[field])
+        line = json.dumps({"kind": kind, **fields}, separators=(",", ":"))
+        data = None
+        with self.lock:
+            self.buffer.append(line)
+            self.recorded += 1
+            if len(self.buffer) >= TRAFFIC_FLUSH_EVERY:
+                data = self._take()
+        if data is not None:
+            self.writer.submit(self._write, data)
+
+    def flush(self):
+        """Write everything recorded so far; returns once it (and earlier batches) are on disk."""
+        with self.lock:
+            data = self._take()
+        self.writer.submit(self._write, data).result()
+
+    def close(self):
+        self.flush()
+        self.writer.shutdown()
+
+    def _take(self):
+        if not self.buffer:
+            return None
+        data = "\n".join(self.buffer) + "\n"
+        self.buffer = []
+        return data
+
+    def _write(self, data):
+        if data is None:
+            return
+        try:
+            opener = gzip.open if self.path.endswith(".gz") else open
+            with opener(self.path, "at") as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Could not write traffic trace to {self.path}: {e}")
+
+
+recorder = TrafficRecorder(TRAFFIC_RECORD_PATH) if TRAFFIC_RECORD_PATH else None
+
+
+def start_recording(path):
+    """Start (or restart) recording to path; returns the recorder."""
+    global recorder
+    if recorder is not None:
+        recorder.close()
+    recorder = TrafficRecorder(path)
+    return recorder
+
+
+def stop_recording():
+    global recorder
+    if recorder is not None:
+        recorder.close()
+    recorder = None
+
+
+def flush_traffic():
+    if recorder is not None:
+        recorder.flush()
+
+
+def record_event(kind, **fields):
+    if recorder is not None:
+        recorder.record(kind, **fields)
+
+
+def trace_offset():
+    return recorder.offset() if recorder is not None else None
+
+
+def annotate(**fields):
+    """Add fields to the trace event of the HTTP request being served, if it's recorded."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+def _user_from_headers(headers):
+    authorization = headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        return get_user_id_from_token(authorization[7:])
+    except ValueError:
+        return None
+
+
+async def record_http_traffic(request, call_next):
+    """HTTP middleware: record route, status, sizes and latency of every request."""
+    if recorder is None:
+        return await call_next(request)
+    trace = {}
+    token = current_trace.set(trace)
+    t = recorder.offset()
+    started = time.perf_counter()
+    status = 500
+    response_bytes = None
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response_bytes = response.headers.get("content-length")
+        return response
+    finally:
+        current_trace.reset(token)
+        route = request.scope.get("route")
+        path_params = request.scope.get("path_params", {})
+        request_bytes = request.headers.get("content-length")
+        fields = {
+            "t": t,
+            "method": request.method,
+            "route": route.path if route is not None else None,
+            "status": status,
+            "ms": round((time.perf_counter() - started) * 1000, 3),
+            "req_bytes": int(request_bytes) if request_bytes else 0,
+            "resp_bytes": int(response_bytes) if response_bytes else None,
+            "room": path_params.get("room_code"),
+            "msg": path_params.get("message_id"),
+            "user": _user_from_headers(request.headers),
+        }
+        fields.update(trace)
+        record_event("http", **fields)
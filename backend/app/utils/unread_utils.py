@@ -0,0 +1,57 @@
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from app.models.messages import Message
+from app.models.rooms import Room
+from app.models.user_room import UserRoom
+
+
+def record_new_message(db: Session, message: Message) -> None:
+    """
+    Update the room's last message pointer and every member's unread count
+    for a freshly inserted message. Does not commit; call it in the same
+    transaction as the insert.
+    """
+    if message.id is None:
+        db.flush()
+
+    db.execute(
+        update(Room)
+        .where(Room.id == message.room_id)
+        .values(last_message_id=message.id)
+    )
+    # Everyone else in the room has one more unread message
+    db.execute(
+        update(UserRoom)
+        .where(UserRoom.room_id == message.room_id, UserRoom.user_id != message.user_id)
+        .values(unread_count=UserRoom.unread_count + 1)
+    )
+    # The sender has obviously seen the room up to their own message
+    db.execute(
+        update(UserRoom)
+        .where(UserRoom.room_id == message.room_id, UserRoom.user_id == message.user_id)
+        .values(last_read_message_id=message.id, unread_count=0)
+    )
+
+
+def mark_room_read(db: Session, membership: UserRoom, message_id: int | None, last_message_id: int | None) -> UserRoom:
+    """
+    Move a member's read cursor forward to message_id (or to the newest
+    message when None) and recompute their unread count with an indexed
+    range count. The cursor never moves backwards or past the room's newest
+    message; a cursor already past it is pulled back. Does not commit.
+    """
+    target = message_id if message_id is not None else last_message_id
+    if target is None:
+        return membership
+    if last_message_id is not None:
+        target = min(target, last_message_id)
+    current = membership.last_read_message_id
+    if current is not None and target <= current and (last_message_id is None or current <= last_message_id):
+        return membership
+
+    membership.last_read_message_id = target
+    membership.unread_count = db.query(func.count(Message.id)).filter(
+        Message.room_id == membership.room_id,
+        Message.id > target
+    ).scalar() or 0
+    return membership
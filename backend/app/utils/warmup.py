@@ -0,0 +1,105 @@
+import asyncio
+import importlib
+import os
+import time
+from sqlalchemy import text
+from app.db import engine, SessionLocal, DATABASE_URL
+from app.utils.bot_utils import get_or_create_bot_user
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Apply pending Alembic migrations during warmup instead of reporting not-ready
+WARMUP_RUN_MIGRATIONS = os.getenv("WARMUP_RUN_MIGRATIONS", "0") == "1"
+
+# Connections opened up front so the first requests don't pay for connecting
+WARMUP_POOL_CONNECTIONS = 5
+
+# Heavy libraries that are imported lazily by the code paths that need them
+WARMUP_IMPORTS = ["openai", "passlib.context", "bcrypt"]
+
+# Filled in by warm_up(); /ready reports it
+warmup_state = {
+    "ready": False,
+    "steps": {},  # step name -> seconds taken
+    "error": None,
+}
+
+
+def alembic_config():
+    # Alembic is imported here, in the warmup thread, to keep it off the cold import path
+    from alembic.config import Config
+    # Not loaded from alembic.ini so env.py leaves the server's logging alone
+    config = Config()
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    config.set_main_option("sqlalchemy.url", DATABASE_URL)
+    return config
+
+
+def check_schema():
+    # Alembic owns the schema: the app is only ready once the DB is at the latest revision
+    from alembic import command
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    config = alembic_config()
+    expected = set(ScriptDirectory.from_config(config).get_heads())
+    with engine.connect() as connection:
+        current = set(MigrationContext.configure(connection).get_current_heads())
+    if current == expected:
+        return
+    if WARMUP_RUN_MIGRATIONS:
+        command.upgrade(config, "head")
+        return
+    raise RuntimeError(
+        f"Database is at revision {', '.join(sorted(current)) or 'none'}, expected "
+        f"{', '.join(sorted(expected))}; run `alembic upgrade head`"
+    )
+
+
+def resolve_bot_user():
+    db = SessionLocal()
+    try:
+        return get_or_create_bot_user(db)
+    finally:
+        db.close()
+
+
+def open_pool_connections(count=WARMUP_POOL_CONNECTIONS):
+    # Check out several connections at once so the pool really opens that many
+    connections = [engine.connect() for _ in range(count)]
+    try:
+        for connection in connections:
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def import_heavy_modules():
+    from app.utils.auth_utils import get_pwd_context
+    for name in WARMUP_IMPORTS:
+        importlib.import_module(name)
+    get_pwd_context()
+
+
+WARMUP_STEPS = [
+    ("schema", check_schema),
+    ("bot_user", resolve_bot_user),
+    ("db_pool", open_pool_connections),
+    ("imports", import_heavy_modules),
+]
+
+
+async def warm_up():
+    """
+    Run the startup steps off the event loop, then mark the app ready.
+    The app keeps serving while this runs; /ready answers 503 until it is done.
+    """
+    try:
+        for name, step in WARMUP_STEPS:
+            started = time.perf_counter()
+            await asyncio.to_thread(step)
+            warmup_state["steps"][name] = round(time.perf_counter() - started, 4)
+        warmup_state["ready"] = True
+    except Exception as e:
+        warmup_state["error"] = f"{type(e).__name__}: {e}"
+        print(f"Warmup failed: {warmup_state['error']}")
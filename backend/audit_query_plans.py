@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Query-plan audit: build a scratch database with the Alembic migrations,
+drive every route and the bot worker (against an in-process fake LLM),
+capture each SQL statement they issue and fail if SQLite would answer any
+of them with a full table scan.
+
+Run it in CI or before merging anything that adds a query:
+
+    python audit_query_plans.py [--verbose]
+
+Requires httpx for FastAPI's TestClient.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Add the backend directory to the Python path
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BACKEND_DIR)
+
+
+def migrate():
+    # alembic/env.py picks up DATABASE_URL
+    from alembic import command
+    from alembic.config import Config
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    command.upgrade(config, "head")
+
+
+def wait_for_bot(websocket, message_id, limit=500):
+    for _ in range(limit):
+        event = websocket.receive_json()
+        if event.get("type") == "bot_message_end" and event.get("message_id") == message_id:
+            return event
+    raise RuntimeError("bot reply never finished")
+
+
+def exercise_app(client):
+    """Hit every route the way the frontend does, including a full bot round trip."""
+    def auth(token):
+        return {"Authorization": f"Bearer {token}"}
+
+    owner = client.post("/auth/signup", json={"username": "audit_owner", "password": "pw"}).json()["access_token"]
+    member = client.post("/auth/signup", json={"username": "audit_member", "password": "pw"}).json()["access_token"]
+    client.post("/auth/login", json={"username": "audit_owner", "password": "pw"})
+    client.get("/auth/me", headers=auth(owner))
+
+    room_code = client.post("/create_room", json={"name": "audit room", "api_key": "audit-key"}, headers=auth(owner)).json()["room_code"]
+    client.post(f"/rooms/{room_code}/join", headers=auth(member))
+    client.post(f"/rooms/{room_code}/join", headers=auth(member))  # already a member
+    client.get(f"/rooms/{room_code}")
+
+    for i in range(3):
+        client.post(f"/room/{room_code}/send_message", json={"content": f"hello {i}"}, headers=auth(owner))
+
+    with client.websocket_connect(f"/ws/room/{room_code}?token={member}") as websocket:
+        websocket.receive_json()  # welcome
+        command = client.post(f"/room/{room_code}/send_message", json={"content": "@bot summarize"}, headers=auth(member)).json()
+        wait_for_bot(websocket, command["message_id"])
+        time.sleep(1.2)  # let the socket's poller run at least once more
+
+    messages = client.get(f"/room/{room_code}/messages", headers=auth(member)).json()["messages"]
+    client.get(f"/room/{room_code}/messages", params={"after_id": messages[0]["message_id"]}, headers=auth(member))
+    client.get("/rooms/my_rooms", headers=auth(member))
+    client.post(f"/room/{room_code}/read", json={"message_id": messages[1]["message_id"]}, headers=auth(member))
+    client.post(f"/room/{room_code}/read", json={}, headers=auth(member))
+    client.post(f"/room/{room_code}/bot/{command['message_id']}/cancel", headers=auth(member))
+
+    from llm.usage import flush_usage_now
+    flush_usage_now()
+    client.get(f"/rooms/{room_code}/usage", headers=auth(owner))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="print every captured statement with its plan")
+    args = parser.parse_args()
+
+    try:
+        from fastapi.testclient import TestClient
+    except RuntimeError as e:
+        sys.exit(f"{e}\nInstall httpx to run the audit.")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # Must be set before the app (and app.db) is imported
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'audit.db')}"
+        migrate()
+
+        import main as app_main
+        from app.db import engine
+        from app.utils.query_audit import QueryPlanAudit
+        from llm import llm_queue, model_router
+        from llm.fake_llm import FakeLLM
+
+        model_router.set_stream_factory(FakeLLM(reply_chars=200, first_token_delay=0.01, chunk_delay=0))
+        llm_queue.CANCEL_WHEN_UNSUBSCRIBED = False
+
+        # Warmup reads the one-row alembic_version table to check the schema
+        with QueryPlanAudit(engine, allow_scans={"alembic_version"}) as audit:
+            with TestClient(app_main.app) as client:
+                exercise_app(client)
+
+        plans = audit.plans()
+        if args.verbose:
+            for statement, calls, details in plans:
+                print(f"[{calls}x] {' '.join(statement.split())}")
+                for detail in details:
+                    print(f"    {detail}")
+        print(f"Captured {len(plans)} distinct statements")
+
+        try:
+            audit.assert_no_full_scans()
+        except AssertionError as e:
+            print(e)
+            sys.exit(1)
+        print("No full table scans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark how long it takes to import the app (what every new worker pays
+before it can serve) and which modules dominate it.
+
+Usage: python bench_startup.py [--runs N] [--top N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def time_import(runs):
+    # Fresh interpreter per run so nothing is cached in sys.modules
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND_DIR, check=True)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def import_profile():
+    # -X importtime writes "import time: self [us] | cumulative | imported package" to stderr
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings = time_import(args.runs)
+    print(f"'import main' in a fresh interpreter ({args.runs} runs, includes interpreter start):")
+    print(f"  min {min(timings) * 1000:.0f} ms  median {statistics.median(timings) * 1000:.0f} ms  max {max(timings) * 1000:.0f} ms")
+
+    rows = import_profile()
+    # Nesting is shown by indenting the package name; what main pulls in sits one level below it
+    indent = min(len(name) - len(name.lstrip()) for _, _, name in rows)
+    direct = [row for row in rows if len(row[2]) - len(row[2].lstrip()) == indent + 2]
+    print(f"\nTop {args.top} imports by cumulative time (one level below the entry point):")
+    for cumulative_us, self_us, name in sorted(direct, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name.strip()}")
+
+    print(f"\nTop {args.top} modules by self time:")
+    for cumulative_us, self_us, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name.strip()}")
+
+    heavy = {"openai", "passlib", "bcrypt", "alembic"}
+    loaded = sorted({row[2].strip() for row in rows} & heavy)
+    if loaded:
+        print(f"\nWarning: heavy modules imported eagerly at startup: {', '.join(loaded)}")
+
+
+if __name__ == "__main__":
+    main()
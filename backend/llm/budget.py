@@ -0,0 +1,41 @@
+import time
+
+# Hard cap on the length of a single bot reply
+MAX_OUTPUT_TOKENS = 2048
+
+# Output tokens a room may spend on bot replies per window
+ROOM_TOKEN_BUDGET = 50000
+ROOM_BUDGET_WINDOW_SECONDS = 3600
+
+# room_id -> [window_start, tokens_used]
+room_token_usage = {}
+
+
+def estimate_tokens(text):
+    """Rough token count for streamed text (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _room_window(room_id):
+    now = time.monotonic()
+    window = room_token_usage.get(room_id)
+    if window is None or now - window[0] >= ROOM_BUDGET_WINDOW_SECONDS:
+        window = [now, 0]
+        room_token_usage[room_id] = window
+    return window
+
+
+def remaining_room_budget(room_id):
+    return max(0, ROOM_TOKEN_BUDGET - _room_window(room_id)[1])
+
+
+def charge_room(room_id, tokens):
+    """Record tokens spent by the room and return what is left of its budget."""
+    window = _room_window(room_id)
+    window[1] += tokens
+    return max(0, ROOM_TOKEN_BUDGET - window[1])
+
+
+def output_token_limit(room_id):
+    """Max tokens the next reply in this room may produce."""
+    return min(MAX_OUTPUT_TOKENS, remaining_room_budget(room_id))
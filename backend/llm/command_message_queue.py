@@ -1,5 +1,4 @@
 import asyncio
-from openai import OpenAI
 
 async def process_command_messages(question: str, api_key: str):
     command_messages = question.replace("@bot", "").strip()
@@ -10,27 +9,52 @@ async def process_command_messages(question: str, api_key: str):
 
     await asyncio.sleep(5)  # Poll every 5 seconds
 
-async def call_gemini_api(prompt: str, api_key: str):
+# Seconds to wait on connect and between streamed chunks before giving up
+UPSTREAM_TIMEOUT_SECONDS = 30
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+GEMINI_MODEL = "gemini-2.5-flash"
+
+async def stream_gemini_api(prompt: str, api_key: str, max_tokens: int | None = None,
+                            model: str = GEMINI_MODEL, base_url: str = GEMINI_BASE_URL):
+    """
+    Stream the reply to prompt chunk by chunk as it arrives from Gemini (or
+    any other OpenAI-compatible endpoint at base_url).
+    Closing the generator aborts the upstream request.
+    """
+    # Imported here rather than at module level so app startup doesn't pay for it
+    from openai import AsyncOpenAI, NOT_GIVEN
+
     # Create client with the provided API key
-    client = OpenAI(
+    client = AsyncOpenAI(
         api_key=api_key,
-        base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
+        base_url=base_url,
+        timeout=UPSTREAM_TIMEOUT_SECONDS,
+        max_retries=0
     )
-    
-    response = client.chat.completions.create(
-        model="gemini-2.5-flash",
+
+    response = await client.chat.completions.create(
+        model=model,
         messages=[
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ],
-        stream = True
+        stream = True,
+        max_tokens=max_tokens if max_tokens is not None else NOT_GIVEN
     )
-    
-    # Collect all chunks into a list to avoid iteration issues
+
+    try:
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await response.close()
+
+async def call_gemini_api(prompt: str, api_key: str):
+    # Collect all chunks into a list for callers that want the whole reply
     chunks = []
-    for chunk in response:
-        if chunk.choices[0].delta.content:
-            chunks.append(chunk.choices[0].delta.content)
+    async for chunk in stream_gemini_api(prompt, api_key):
+        chunks.append(chunk)
     
     return chunks
 
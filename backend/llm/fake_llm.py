@@ -0,0 +1,45 @@
+import asyncio
+import random
+
+
+class FakeLLM:
+    """
+    In-process stand-in for an upstream model, for audits, replays and local
+    load tests. Install it with model_router.set_stream_factory(FakeLLM(...)).
+
+    Replies are reply_chars long (or whatever reply_chars_for(prompt) says),
+    cut into chunk_chars pieces, with first_token_delay before the first one
+    and chunk_delay between the rest. speed divides every delay.
+    """
+    def __init__(self, reply_chars=400, chunk_chars=20, first_token_delay=0.2, chunk_delay=0.02,
+                 jitter=0.0, speed=1.0, reply_chars_for=None, seed=None):
+        self.reply_chars = reply_chars
+        self.chunk_chars = chunk_chars
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.speed = speed
+        self.reply_chars_for = reply_chars_for
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def _delay(self, seconds):
+        if self.jitter:
+            seconds *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(0.0, seconds / self.speed)
+
+    def __call__(self, endpoint, prompt, api_key, max_tokens):
+        self.calls += 1
+        length = self.reply_chars_for(prompt) if self.reply_chars_for else self.reply_chars
+        if max_tokens is not None:
+            length = min(length, max_tokens * 4)
+        return self._stream(endpoint, length)
+
+    async def _stream(self, endpoint, length):
+        await asyncio.sleep(self._delay(self.first_token_delay))
+        text = f"[{endpoint.name}] " + "lorem ipsum dolor sit amet " * (length // 27 + 1)
+        text = text[:length]
+        for start in range(0, len(text), self.chunk_chars):
+            if start:
+                await asyncio.sleep(self._delay(self.chunk_delay))
+            yield text[start:start + self.chunk_chars]
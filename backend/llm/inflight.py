@@ -0,0 +1,91 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+
+# Checkpoint a long reply to the DB once this much time has passed since the last checkpoint...
+CHECKPOINT_INTERVAL_SECONDS = 5.0
+# ...and at least this many new characters have arrived
+CHECKPOINT_MIN_CHARS = 512
+
+
+class InflightGeneration:
+    """
+    A bot reply that is still being streamed. Holds everything generated so
+    far so that sockets connecting mid-answer can catch up with a snapshot.
+    """
+    def __init__(self, room_id, message_id):
+        self.room_id = room_id
+        self.message_id = message_id  # id of the @bot command being answered
+        self.bot_message_id = None  # id of the bot's row in messages, once checkpointed
+        self.chunks = []
+        self.length = 0
+        self.started_at = datetime.utcnow()
+        self.checkpointed_length = 0
+        self.last_checkpoint = time.monotonic()
+
+    def append(self, chunk):
+        """Add a chunk and return its offset in the full reply."""
+        offset = self.length
+        self.chunks.append(chunk)
+        self.length += len(chunk)
+        return offset
+
+    def content(self):
+        # Join once and keep the result so repeated snapshots stay cheap
+        if len(self.chunks) > 1:
+            self.chunks = ["".join(self.chunks)]
+        return self.chunks[0] if self.chunks else ""
+
+    def should_checkpoint(self):
+        return (
+            self.length - self.checkpointed_length >= CHECKPOINT_MIN_CHARS
+            and time.monotonic() - self.last_checkpoint >= CHECKPOINT_INTERVAL_SECONDS
+        )
+
+    def mark_checkpointed(self):
+        self.checkpointed_length = self.length
+        self.last_checkpoint = time.monotonic()
+
+    def snapshot(self):
+        return {
+            "type": "bot_message_snapshot",
+            "message_id": self.message_id,
+            "bot_message_id": self.bot_message_id,
+            "content": self.content(),
+            "offset": 0,
+            "length": self.length,
+            "started_at": self.started_at.isoformat()
+        }
+
+
+# room_id -> {command message_id: InflightGeneration}
+inflight_generations = defaultdict(dict)
+
+
+def start_generation(room_id, message_id):
+    generation = InflightGeneration(room_id, message_id)
+    inflight_generations[room_id][message_id] = generation
+    return generation
+
+
+def finish_generation(room_id, message_id):
+    room_generations = inflight_generations.get(room_id)
+    if room_generations is None:
+        return
+    room_generations.pop(message_id, None)
+    if not room_generations:
+        del inflight_generations[room_id]
+
+
+def inflight_bot_message_ids(room_id):
+    """Ids of bot rows that have been checkpointed but are still being generated."""
+    return [
+        generation.bot_message_id
+        for generation in inflight_generations.get(room_id, {}).values()
+        if generation.bot_message_id is not None
+    ]
+
+
+def get_room_snapshots(room_id):
+    """Snapshots of every reply currently being generated in the room."""
+    return [generation.snapshot() for generation in inflight_generations.get(room_id, {}).values()]
@@ -4,7 +4,15 @@ from app.models.messages import Message
 from app.models.rooms import Room
 from app.db import get_db
 from app.utils.bot_utils import get_or_create_bot_user
-from llm.command_message_queue import call_gemini_api  # import your Gemini API call
+from app.utils.unread_utils import record_new_message
+from app.routes.msg_socket import active_connections
+from llm.model_router import route_stream
+from llm.inflight import start_generation, finish_generation
+from llm.budget import estimate_tokens, charge_room, output_token_limit
+from llm.usage import record_usage, check_quota
+from app.utils.profiling import profile_request, stage, timed_stream, PROFILE_SLOW_JOB_MS
+from app.utils.traffic import record_event, trace_offset
+from app.utils.compression import Frame, send_frame
 from sqlalchemy.orm import Session
 
 # Global job queue
@@ -13,84 +21,322 @@ job_queue = asyncio.Queue()
 # Per-room locks
 room_locks = defaultdict(asyncio.Lock)
 
+# Total time a job may take from enqueue to its last chunk, queue wait included
+JOB_DEADLINE_SECONDS = 120
+
+# Stop generating once a room has had no subscribed sockets for this long
+CANCEL_WHEN_UNSUBSCRIBED = True
+UNSUBSCRIBED_GRACE_SECONDS = 15
+SUBSCRIBER_CHECK_INTERVAL_SECONDS = 1
+
+# Jobs that are queued or running, keyed by command message id
+active_jobs = {}
+
 # Example job structure: (room_id, message_id, text, api_key)
 class BotJob:
-    def __init__(self, room_id, message_id, text, api_key):
+    def __init__(self, room_id, message_id, text, api_key, user_id=None):
         self.room_id = room_id
         self.message_id = message_id
         self.text = text
         self.api_key = api_key
+        self.user_id = user_id  # who sent the command, allowed to cancel it
+        self.enqueued_at = asyncio.get_running_loop().time()
+        self.deadline = self.enqueued_at + JOB_DEADLINE_SECONDS
+        self.task = None
+        self.cancel_reason = None
 
-async def enqueue_bot_job(room_id, message_id, text, api_key):
-    await job_queue.put(BotJob(room_id, message_id, text, api_key))
+    def cancel(self, reason):
+        """Stop the job; a running generation is aborted at its next await."""
+        if self.cancel_reason is not None:
+            return
+        self.cancel_reason = reason
+        if self.task is not None:
+            self.task.cancel()
+
+class BotJobCancelled(Exception):
+    pass
+
+async def enqueue_bot_job(room_id, message_id, text, api_key, user_id=None):
+    job = BotJob(room_id, message_id, text, api_key, user_id)
+    active_jobs[message_id] = job
+    await job_queue.put(job)
+
+def cancel_bot_job(message_id, reason="requested"):
+    """Cancel a queued or running job. Returns the job, or None if it isn't active."""
+    job = active_jobs.get(message_id)
+    if job is not None:
+        job.cancel(reason)
+    return job
 
 async def worker_loop(worker_id):
+    loop = asyncio.get_running_loop()
     while True:
         job = await job_queue.get()
-        lock = room_locks[job.room_id]
-        async with lock:
-            await process_bot_job(job)
-        job_queue.task_done()
+        try:
+            lock = room_locks[job.room_id]
+            async with lock:
+                if job.cancel_reason is None and loop.time() >= job.deadline:
+                    job.cancel("deadline")
+                if job.cancel_reason is not None:
+                    # Cancelled or expired while waiting in the queue
+                    await finish_cancelled_job(job)
+                    continue
 
-async def process_bot_job(job):
-    # Get database session
-    db: Session = next(get_db())
-    
-    # Get the room to fetch the API key
-    room = db.query(Room).filter_by(id=job.room_id).first()
-    if not room:
-        print(f"Room {job.room_id} not found, skipping job")
+                # A sampled job's task inherits the profile through its context
+                with profile_request(f"bot_job room {job.room_id}", slow_ms=PROFILE_SLOW_JOB_MS):
+                    job.task = asyncio.create_task(process_bot_job(job))
+                    deadline_timer = loop.call_at(job.deadline, job.cancel, "deadline")
+                    watcher = asyncio.create_task(watch_subscribers(job))
+                    try:
+                        await job.task
+                    except asyncio.CancelledError:
+                        # Only swallow cancellations we asked for, not worker shutdown
+                        if job.cancel_reason is None:
+                            raise
+                    finally:
+                        deadline_timer.cancel()
+                        watcher.cancel()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Worker {worker_id} failed on message {job.message_id}: {e}")
+        finally:
+            active_jobs.pop(job.message_id, None)
+            job_queue.task_done()
+
+async def watch_subscribers(job):
+    # Cancel the job once nobody has been listening to the room for a while
+    if not CANCEL_WHEN_UNSUBSCRIBED:
         return
-    
-    # Broadcast start
+    loop = asyncio.get_running_loop()
+    unsubscribed_since = None
+    while True:
+        if active_connections.get(job.room_id):
+            unsubscribed_since = None
+        elif unsubscribed_since is None:
+            unsubscribed_since = loop.time()
+        elif loop.time() - unsubscribed_since >= UNSUBSCRIBED_GRACE_SECONDS:
+            job.cancel("no_subscribers")
+            return
+        await asyncio.sleep(SUBSCRIBER_CHECK_INTERVAL_SECONDS)
+
+async def finish_cancelled_job(job):
+    # Mark the command as handled so it isn't left pending forever
+    db: Session = next(get_db())
+    try:
+        db.query(Message).filter_by(id=job.message_id).update({"processed": True})
+        db.commit()
+    finally:
+        db.close()
     await broadcast_to_room(job.room_id, {
-        "type": "bot_message_start",
-        "message_id": job.message_id
+        "type": "bot_message_cancelled",
+        "message_id": job.message_id,
+        "reason": job.cancel_reason
     })
 
-    # Call Gemini API with stream=True using the room's API key
-    response_chunks = await call_gemini_api(job.text, room.api_key)
-    
-    # Stream each chunk to the room
-    for chunk in response_chunks:
-        await broadcast_to_room(job.room_id, {
-            "type": "bot_message_delta",
+async def process_bot_job(job):
+    # Get database session
+    db: Session = next(get_db())
+    try:
+        # Get the room to fetch the API key
+        room = db.query(Room).filter_by(id=job.room_id).first()
+        if not room:
+            print(f"Room {job.room_id} not found, skipping job")
+            return
+
+        quota = check_quota(db, job.room_id, room.api_key)
+        if quota is not None:
+            job.cancel_reason = quota
+            await finish_cancelled_job(job)
+            return
+
+        max_tokens = output_token_limit(job.room_id)
+        if max_tokens <= 0:
+            job.cancel_reason = "room_budget"
+            await finish_cancelled_job(job)
+            return
+
+        # Get or create the bot user
+        bot_user_id = get_or_create_bot_user(db)
+
+        # Register the generation so sockets joining mid-answer get a snapshot
+        generation = start_generation(job.room_id, job.message_id)
+        try:
+            error = await stream_bot_reply(db, job, room, generation, bot_user_id, max_tokens)
+        finally:
+            # Always unregister, even if saving failed, so sockets don't get stale snapshots
+            finish_generation(job.room_id, job.message_id)
+
+        # Broadcast end
+        end_event = {
+            "type": "bot_message_end",
             "message_id": job.message_id,
-            "content": chunk
+            "bot_message_id": generation.bot_message_id
+        }
+        if job.cancel_reason is not None:
+            end_event["cancelled"] = job.cancel_reason
+        if error is not None:
+            end_event["error"] = error
+        await broadcast_to_room(job.room_id, end_event)
+    finally:
+        db.close()
+
+async def stream_bot_reply(db: Session, job, room, generation, bot_user_id, max_tokens):
+    """
+    Stream the reply into generation, broadcasting deltas, then save it and
+    mark the command processed. Returns an error message or None.
+    """
+    # Read before anything can roll back the session and expire room
+    room_code, api_key = room.code, room.api_key
+    stream = None
+    error = None
+    cancelled = None
+    route_info = {}
+    started_at = asyncio.get_running_loop().time()
+    first_token_at = None
+    trace_t = trace_offset()
+    try:
+        # Broadcast start
+        await broadcast_to_room(job.room_id, {
+            "type": "bot_message_start",
+            "message_id": job.message_id
         })
 
-    # Broadcast end
-    await broadcast_to_room(job.room_id, {
-        "type": "bot_message_end",
-        "message_id": job.message_id
-    })
+        # Stream the reply using the room's API key, forwarding chunks as they arrive.
+        # The router hedges slow first tokens and falls back to other models on errors.
+        stream = timed_stream(route_stream(job.text, api_key, max_tokens=max_tokens, route_info=route_info), "llm")
+        async for chunk in stream:
+            if first_token_at is None:
+                first_token_at = asyncio.get_running_loop().time()
+            offset = generation.append(chunk)
+            await broadcast_to_room(job.room_id, {
+                "type": "bot_message_delta",
+                "message_id": job.message_id,
+                "content": chunk,
+                "offset": offset
+            })
+            # Enforce the limits ourselves too, in case upstream ignores max_tokens
+            tokens = estimate_tokens(chunk)
+            max_tokens -= tokens
+            if charge_room(job.room_id, tokens) <= 0:
+                job.cancel_reason = "room_budget"
+                raise BotJobCancelled()
+            if max_tokens <= 0:
+                job.cancel_reason = "max_tokens"
+                raise BotJobCancelled()
+            if generation.should_checkpoint():
+                save_bot_message(db, generation, bot_user_id)
+                db.commit()
+    except asyncio.CancelledError as e:
+        if job.cancel_reason is None:
+            # Not one of our cancels (e.g. worker shutdown): re-raised once the reply is saved
+            cancelled = e
+    except BotJobCancelled:
+        pass
+    except Exception as e:
+        print(f"Bot generation failed for message {job.message_id}: {e}")
+        error = str(e)
+        db.rollback()
 
-    # Insert bot reply into DB and mark command as processed
-    # Create the full response by joining all chunks
-    full_response = "".join(response_chunks)
-    
-    # Get or create the bot user
-    bot_user_id = get_or_create_bot_user(db)
-    
-    bot_message = Message(
-        room_id=job.room_id,
-        user_id=bot_user_id,  # Use the bot user's ID
-        content=full_response,
-        message_type="bot"
+    if stream is not None:
+        # Abort the upstream request right away instead of waiting for garbage collection.
+        # A cancel landing during this await must not skip saving what was generated.
+        try:
+            await stream.aclose()
+        except asyncio.CancelledError as e:
+            if job.cancel_reason is None:
+                cancelled = cancelled or e
+
+    # Account every upstream call (hedges and fallbacks too) against the room's key;
+    # counters are flushed to the DB in batches. Each call was sent the prompt
+    attempts = route_info.get("attempts", 1)
+    record_usage(
+        job.room_id, api_key,
+        requests=attempts,
+        prompt_tokens=estimate_tokens(job.text) * attempts,
+        completion_tokens=estimate_tokens(generation.content()),
+        latency_ms=(asyncio.get_running_loop().time() - started_at) * 1000,
+        error=error is not None
+    )
+
+    # Insert (or finish) whatever was generated and mark command as processed
+    try:
+        if generation.length:
+            save_bot_message(db, generation, bot_user_id, final=True)
+        db.query(Message).filter_by(id=job.message_id).update({"processed": True})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Could not save bot reply for message {job.message_id}: {e}")
+        error = error or f"Could not save reply: {e}"
+        try:
+            # Don't leave the command pending forever
+            db.query(Message).filter_by(id=job.message_id).update({"processed": True})
+            db.commit()
+        except Exception:
+            db.rollback()
+
+    # Timing and sizes only, for replay_traffic.py
+    finished_at = asyncio.get_running_loop().time()
+    record_event(
+        "bot_job",
+        t=trace_t,
+        room=room_code,
+        user=job.user_id,
+        msg=job.message_id,
+        prompt_chars=len(job.text),
+        reply_chars=generation.length,
+        queue_ms=round((started_at - job.enqueued_at) * 1000, 3),
+        first_token_ms=round((first_token_at - started_at) * 1000, 3) if first_token_at is not None else None,
+        ms=round((finished_at - started_at) * 1000, 3),
+        cancelled=job.cancel_reason,
+        error=error is not None
     )
-    db.add(bot_message)
-    
-    # Mark original command as processed
-    command_msg = db.query(Message).filter_by(id=job.message_id).first()
-    if command_msg:
-        command_msg.processed = True
-    
-    db.commit()
-    db.close()
+
+    if cancelled is not None:
+        # Not one of our cancels (e.g. worker shutdown): keep propagating
+        raise cancelled
+    return error
+
+def save_bot_message(db: Session, generation, bot_user_id, final=False):
+    """
+    Write the reply generated so far to the DB. The first call inserts the
+    bot message, later calls update it. Bot rows stay processed=False until
+    the final write so pollers don't pick up a partial reply.
+    """
+    content = generation.content()
+    if generation.bot_message_id is None:
+        bot_message = Message(
+            room_id=generation.room_id,
+            user_id=bot_user_id,  # Use the bot user's ID
+            content=content,
+            message_type="bot",
+            processed=final
+        )
+        db.add(bot_message)
+        db.flush()
+        record_new_message(db, bot_message)
+        generation.bot_message_id = bot_message.id
+    else:
+        db.query(Message).filter_by(id=generation.bot_message_id).update(
+            {**Message.content_values(content), Message.processed: final}
+        )
+    generation.mark_checkpointed()
 
 async def broadcast_to_room(room_id, message):
-    # Implement this to send message over WebSocket to all clients in the room
-    pass
+    # Send to every socket subscribed to the room; drop the ones that have gone away
+    connections = list(active_connections.get(room_id, []))
+    if not connections:
+        return
+    frame = Frame(message)
+    with stage("fanout"):
+        results = await asyncio.gather(
+            *(send_frame(connection, frame) for connection in connections),
+            return_exceptions=True
+        )
+    for connection, result in zip(connections, results):
+        if isinstance(result, Exception) and connection in active_connections.get(room_id, []):
+            active_connections[room_id].remove(connection)
 
 async def start_worker_pool(num_workers=5):
     workers = [asyncio.create_task(worker_loop(i)) for i in range(num_workers)]
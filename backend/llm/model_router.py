@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+from llm.command_message_queue import stream_gemini_api, GEMINI_BASE_URL, GEMINI_MODEL
+
+
+class ModelEndpoint:
+    """
+    An OpenAI-compatible model the bot can be answered by. api_key falls
+    back to the room's key when not set.
+    """
+    def __init__(self, name, model, base_url, api_key=None):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+
+    def __repr__(self):
+        return f"ModelEndpoint({self.name!r}, {self.model!r}, {self.base_url!r})"
+
+
+def load_endpoints():
+    """
+    Endpoints in routing order: the first is the primary, the rest are used
+    for hedging and fallback. BOT_MODEL_ENDPOINTS may hold a JSON list of
+    {"name", "model", "base_url", "api_key"} objects, e.g. to point the bot
+    at local fake servers.
+    """
+    raw = os.getenv("BOT_MODEL_ENDPOINTS")
+    if raw:
+        return [
+            ModelEndpoint(e.get("name", e["model"]), e["model"], e["base_url"], e.get("api_key"))
+            for e in json.loads(raw)
+        ]
+    return [
+        ModelEndpoint("gemini-flash", GEMINI_MODEL, GEMINI_BASE_URL),
+        ModelEndpoint("gemini-flash-lite", "gemini-2.5-flash-lite", GEMINI_BASE_URL),
+    ]
+
+
+MODEL_ENDPOINTS = load_endpoints()
+
+# Fire a hedged request at the next endpoint if no token has arrived after this long.
+# Gemini 2.5's time to first token is often over 2s, so keep this well above it
+HEDGE_DELAY_SECONDS = float(os.getenv("BOT_HEDGE_DELAY_SECONDS", "6.0"))
+
+# Off by default: every hedge is a second paid call on the room's API key.
+# Without it the router only falls back to the next endpoint on errors
+HEDGING_ENABLED = os.getenv("BOT_HEDGING_ENABLED", "0") == "1"
+
+
+# Opens the chunk stream for one endpoint; swapped out to run against an in-process fake
+stream_factory = None
+
+
+def default_stream_factory(endpoint, prompt, api_key, max_tokens):
+    return stream_gemini_api(
+        prompt, endpoint.api_key or api_key, max_tokens=max_tokens,
+        model=endpoint.model, base_url=endpoint.base_url
+    )
+
+
+def set_stream_factory(factory):
+    """Use factory(endpoint, prompt, api_key, max_tokens) -> async generator of chunks, or None for the default."""
+    global stream_factory
+    stream_factory = factory
+
+
+def _open_stream(endpoint, prompt, api_key, max_tokens):
+    factory = stream_factory or default_stream_factory
+    return factory(endpoint, prompt, api_key, max_tokens)
+
+
+async def _close_attempt(task, stream):
+    # Abort a losing or failed attempt and its upstream request
+    if not task.done():
+        task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    try:
+        await stream.aclose()
+    except Exception:
+        pass
+
+
+async def route_stream(prompt, api_key, max_tokens=None, endpoints=None, route_info=None):
+    """
+    Stream a reply, racing endpoints for the first token.
+
+    The primary endpoint is tried first. If it hasn't produced a token within
+    HEDGE_DELAY_SECONDS, the next endpoint is fired as well and whichever
+    streams first wins; the other request is cancelled. An endpoint that
+    fails before its first token is replaced by the next one. Once a token
+    has been yielded the winner is committed to; later errors propagate.
+
+    route_info, if given, is filled with the winning endpoint and how many
+    endpoints were tried. "attempts" is kept up to date as requests are sent,
+    so it is right even when every endpoint fails or the stream is cancelled.
+    """
+    endpoints = endpoints if endpoints is not None else MODEL_ENDPOINTS
+    if not endpoints:
+        raise RuntimeError("No model endpoints configured")
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    attempts = {}  # first-chunk task -> (endpoint, stream)
+    next_index = 0
+    last_error = None
+    winner = None
+
+    def launch():
+        nonlocal next_index
+        endpoint = endpoints[next_index]
+        next_index += 1
+        stream = _open_stream(endpoint, prompt, api_key, max_tokens)
+        task = asyncio.ensure_future(stream.__anext__())
+        attempts[task] = (endpoint, stream)
+        if route_info is not None:
+            route_info["attempts"] = next_index
+
+    try:
+        launch()
+        while winner is None:
+            if not attempts:
+                if next_index >= len(endpoints):
+                    raise last_error or RuntimeError("All model endpoints failed")
+                launch()
+                continue
+
+            can_hedge = HEDGING_ENABLED and next_index < len(endpoints)
+            done, _ = await asyncio.wait(
+                attempts.keys(),
+                timeout=HEDGE_DELAY_SECONDS if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # Primary is slow to produce its first token: hedge
+                launch()
+                continue
+
+            for task in done:
+                endpoint, stream = attempts.pop(task)
+                error = None if task.cancelled() else task.exception()
+                if winner is None and not task.cancelled() and error is None:
+                    winner = (endpoint, stream, task.result())
+                elif winner is None and isinstance(error, StopAsyncIteration):
+                    # Empty reply still counts as an answer
+                    winner = (endpoint, stream, None)
+                else:
+                    if error is not None and not isinstance(error, StopAsyncIteration):
+                        last_error = error
+                        print(f"Model endpoint {endpoint.name} failed: {error}")
+                    await _close_attempt(task, stream)
+
+        # Cancel the losers
+        for task, (endpoint, stream) in list(attempts.items()):
+            await _close_attempt(task, stream)
+        attempts.clear()
+
+        endpoint, stream, first_chunk = winner
+        if route_info is not None:
+            route_info["endpoint"] = endpoint.name
+            route_info["model"] = endpoint.model
+            route_info["first_token_seconds"] = loop.time() - started_at
+
+        if first_chunk is None:
+            return
+        yield first_chunk
+        async for chunk in stream:
+            yield chunk
+    finally:
+        for task, (endpoint, stream) in list(attempts.items()):
+            await _close_attempt(task, stream)
+        if winner is not None:
+            await winner[1].aclose()
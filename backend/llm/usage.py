@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+from datetime import datetime
+from sqlalchemy.orm import Session
+from app.db import SessionLocal
+from app.models.room_usage import RoomUsage
+
+# How often buffered counters are written to room_usage
+USAGE_FLUSH_INTERVAL_SECONDS = 30
+
+# Daily quotas per room and API key; None means unlimited
+ROOM_DAILY_REQUEST_QUOTA = None
+ROOM_DAILY_TOKEN_QUOTA = None
+
+COUNTER_FIELDS = ("requests", "errors", "prompt_tokens", "completion_tokens", "latency_ms_total")
+
+
+def hash_api_key(api_key):
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+
+def _empty_counters():
+    return dict.fromkeys(COUNTER_FIELDS, 0)
+
+
+# (room_id, api_key_hash, day) -> counters not yet written to the DB
+pending_usage = {}
+
+# (room_id, api_key_hash, day) -> counters already in the DB, loaded on first use
+flushed_usage = {}
+
+
+def _usage_key(room_id, api_key):
+    return (room_id, hash_api_key(api_key), datetime.utcnow().date())
+
+
+def record_usage(room_id, api_key, prompt_tokens=0, completion_tokens=0, latency_ms=0, error=False, requests=1):
+    """
+    Count a bot reply that took `requests` upstream calls (hedges and
+    fallbacks included). Only touches memory; flush_usage writes it out.
+    """
+    key = _usage_key(room_id, api_key)
+    counters = pending_usage.get(key)
+    if counters is None:
+        counters = pending_usage[key] = _empty_counters()
+    counters["requests"] += requests
+    counters["errors"] += 1 if error else 0
+    counters["prompt_tokens"] += prompt_tokens
+    counters["completion_tokens"] += completion_tokens
+    counters["latency_ms_total"] += int(latency_ms)
+
+
+def _load_flushed(db: Session, key):
+    counters = flushed_usage.get(key)
+    if counters is None:
+        room_id, api_key_hash, day = key
+        row = db.query(RoomUsage).filter_by(room_id=room_id, api_key_hash=api_key_hash, day=day).first()
+        counters = {field: getattr(row, field) for field in COUNTER_FIELDS} if row else _empty_counters()
+        # Keep only today's totals around
+        for stale in [k for k in flushed_usage if k[2] != day]:
+            del flushed_usage[stale]
+        flushed_usage[key] = counters
+    return counters
+
+
+def current_usage(db: Session, room_id, api_key):
+    """Today's counters for a room and key: what's in the DB plus what's still buffered."""
+    key = _usage_key(room_id, api_key)
+    totals = dict(_load_flushed(db, key))
+    for field, value in pending_usage.get(key, {}).items():
+        totals[field] += value
+    return totals
+
+
+def check_quota(db: Session, room_id, api_key):
+    """Return the name of the exhausted quota, or None if the room may call the bot."""
+    if ROOM_DAILY_REQUEST_QUOTA is None and ROOM_DAILY_TOKEN_QUOTA is None:
+        return None
+    totals = current_usage(db, room_id, api_key)
+    if ROOM_DAILY_REQUEST_QUOTA is not None and totals["requests"] >= ROOM_DAILY_REQUEST_QUOTA:
+        return "daily_request_quota"
+    if ROOM_DAILY_TOKEN_QUOTA is not None and totals["prompt_tokens"] + totals["completion_tokens"] >= ROOM_DAILY_TOKEN_QUOTA:
+        return "daily_token_quota"
+    return None
+
+
+def flush_usage(db: Session):
+    """Write all buffered counters in one transaction, adding them to existing rows."""
+    if not pending_usage:
+        return 0
+    batch = dict(pending_usage)
+    pending_usage.clear()
+    try:
+        now = datetime.utcnow()
+        for key, counters in batch.items():
+            room_id, api_key_hash, day = key
+            updated = db.query(RoomUsage).filter_by(room_id=room_id, api_key_hash=api_key_hash, day=day).update(
+                {**{field: getattr(RoomUsage, field) + counters[field] for field in COUNTER_FIELDS}, "updated_at": now},
+                synchronize_session=False
+            )
+            if not updated:
+                db.add(RoomUsage(room_id=room_id, api_key_hash=api_key_hash, day=day, updated_at=now, **counters))
+        db.commit()
+    except Exception:
+        db.rollback()
+        # Put the batch back so nothing is lost; it goes out with the next flush
+        for key, counters in batch.items():
+            merged = pending_usage.setdefault(key, _empty_counters())
+            for field in COUNTER_FIELDS:
+                merged[field] += counters[field]
+        raise
+
+    for key, counters in batch.items():
+        flushed = flushed_usage.get(key)
+        if flushed is not None:
+            for field in COUNTER_FIELDS:
+                flushed[field] += counters[field]
+    return len(batch)
+
+
+def flush_usage_now():
+    db = SessionLocal()
+    try:
+        return flush_usage(db)
+    finally:
+        db.close()
+
+
+async def usage_flush_loop(interval=USAGE_FLUSH_INTERVAL_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            flush_usage_now()
+        except Exception as e:
+            print(f"Usage flush failed: {e}")
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Depends
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes.auth import router as auth_router
@@ -6,6 +7,12 @@ from app.routes.room import router as room_router
 from app.routes.messages import router as messages_router
 from app.routes.msg_socket import router as msg_socket_router
 from llm.llm_queue import start_worker_pool
+from llm.usage import usage_flush_loop, flush_usage_now
+from app.utils.warmup import warm_up, warmup_state
+from app.utils.rate_limit import limiter_stats
+from app.utils.profiling import profile_http_requests, instrument_engine
+from app.utils.traffic import record_http_traffic, flush_traffic
+from app.db import engine
 import asyncio
 # Define HTTP Bearer token security scheme
 bearer_scheme = HTTPBearer()
@@ -26,10 +33,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in sampling profiler (PROFILE_SAMPLE_RATE); slow sampled requests are dumped to PROFILE_DIR
+app.middleware("http")(profile_http_requests)
+instrument_engine(engine)
+
+# Anonymized traffic traces for replay_traffic.py when TRAFFIC_RECORD_PATH is set
+app.middleware("http")(record_http_traffic)
+
 @app.on_event("startup")
 async def startup_event():
+    # Resolve the bot user, ensure schema, open DB connections and import heavy libraries;
+    # /ready flips once this is done
+    asyncio.create_task(warm_up())
     # Start the worker pool with 5 workers
     asyncio.create_task(start_worker_pool(5))
+    # Periodically write buffered bot usage counters to the DB
+    asyncio.create_task(usage_flush_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Don't lose usage counted since the last periodic flush
+    flush_usage_now()
+    flush_traffic()
 
 app.include_router(auth_router)
 app.include_router(room_router)
@@ -38,4 +63,15 @@ app.include_router(msg_socket_router)
 
 @app.get("/")
 def read_root():
-    return {"message": "Hello World"}
\ No newline at end of file
+    return {"message": "Hello World"}
+
+@app.get("/ready")
+def readiness():
+    # For load balancers: only route traffic here once the worker is warm
+    status_code = 200 if warmup_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content=warmup_state)
+
+@app.get("/metrics/rate_limits")
+def rate_limit_metrics():
+    # Allowed/rejected counts and live bucket counts per limiter
+    return limiter_stats()
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded traffic trace (see TRAFFIC_RECORD_PATH) against a local
+instance and compare latency distributions with a stored baseline.
+
+The app runs in-process under uvicorn on a scratch database, with the fake
+LLM standing in for the model: each replayed @bot command gets a reply as
+long as the recorded one, with first-token and per-chunk delays taken from
+the trace. HTTP requests and websocket sessions are sent at their recorded
+offsets, divided by --speed.
+
+    python replay_traffic.py trace.jsonl.gz --save-baseline baseline.json
+    python replay_traffic.py trace.jsonl.gz --baseline baseline.json [--speed 4]
+
+Exits 1 if any p50/p90/p99 got slower than the baseline by more than
+--tolerance (relative) and --min-delta-ms (absolute).
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the backend directory to the Python path
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BACKEND_DIR)
+
+PASSWORD = "replay"
+PERCENTILES = (50, 90, 99)
+REPLY_MARKER = re.compile(r"replay:(\d+)")
+
+
+def load_trace(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted((e for e in events if e.get("kind") != "header"), key=lambda e: e.get("t") or 0)
+
+
+def migrate():
+    # alembic/env.py picks up DATABASE_URL
+    from alembic import command
+    from alembic.config import Config
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    command.upgrade(config, "head")
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        key: {"count": len(values), **{f"p{p}": round(percentile(values, p), 3) for p in PERCENTILES}}
+        for key, values in sorted(samples.items()) if values
+    }
+
+
+def fake_llm_for(events, speed):
+    """A FakeLLM paced like the recorded bot jobs, replying with the length asked for in the prompt."""
+    from llm.fake_llm import FakeLLM
+    jobs = [e for e in events if e["kind"] == "bot_job" and e.get("first_token_ms") is not None]
+    chunk_chars = 20
+    first_token_delay = statistics.median(e["first_token_ms"] for e in jobs) / 1000 if jobs else 0.2
+    chunk_delays = [
+        (e["ms"] - e["first_token_ms"]) / 1000 / (e["reply_chars"] / chunk_chars)
+        for e in jobs if e["reply_chars"] > chunk_chars
+    ]
+    default_reply = int(statistics.median(e["reply_chars"] for e in jobs)) if jobs else 400
+
+    def reply_chars_for(prompt):
+        match = REPLY_MARKER.search(prompt)
+        return int(match.group(1)) if match else default_reply
+
+    return FakeLLM(
+        chunk_chars=chunk_chars,
+        first_token_delay=first_token_delay,
+        chunk_delay=statistics.median(chunk_delays) if chunk_delays else 0.02,
+        speed=speed,
+        reply_chars_for=reply_chars_for
+    )
+
+
+def start_server(app):
+    import uvicorn
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            sys.exit("Server failed to start")
+        time.sleep(0.05)
+    wait_until_ready(port)
+    return server, thread, port
+
+
+def wait_until_ready(port, timeout=120):
+    # Replaying during warmup measures the warmup, not the app: wait for /ready to answer 200
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except urllib.error.HTTPError as e:
+            state = json.loads(e.read() or b"{}")
+            if state.get("error"):
+                sys.exit(f"Server warmup failed: {state['error']}")
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            sys.exit(f"Server not ready after {timeout}s")
+        time.sleep(0.1)
+
+
+class Replayer:
+    def __init__(self, events, port, speed, timeout=30):
+        self.events = events
+        self.timeout = timeout
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.ws_url = f"ws://127.0.0.1:{port}"
+        self.speed = speed
+        self.tokens = {}    # user hash -> token
+        self.rooms = {}     # room hash -> room code
+        self.messages = {}  # message hash -> replayed message id
+        self.reply_chars = {e["msg"]: e["reply_chars"] for e in events if e["kind"] == "bot_job"}
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.skipped = Counter()
+        self.counter = 0
+
+    def request(self, method, path, body=None, user=None):
+        """Blocking HTTP call; returns (status, parsed JSON or None, milliseconds)."""
+        headers = {"Content-Type": "application/json"}
+        if user in self.tokens:
+            headers["Authorization"] = f"Bearer {self.tokens[user]}"
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except OSError as e:
+            # Timeouts and refused connections are results too: count them, keep replaying
+            status, payload = type(getattr(e, "reason", e)).__name__, b""
+        ms = (time.perf_counter() - started) * 1000
+        try:
+            return status, json.loads(payload), ms
+        except ValueError:
+            return status, None, ms
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f"{prefix}_{self.counter}"
+
+    # Setup: one account per recorded user, one room per recorded room, memberships as seen
+
+    def set_up(self):
+        users, members, owners = [], defaultdict(list), {}
+        for e in self.events:
+            user, room = e.get("user"), e.get("room")
+            if user and user not in users:
+                users.append(user)
+            if user and room and user not in members[room]:
+                members[room].append(user)
+            if e.get("route") == "/create_room" and room and user:
+                owners.setdefault(room, user)
+
+        def sign_up(user):
+            status, body, _ = self.request("POST", "/auth/signup", {"username": f"replay_{user}", "password": PASSWORD})
+            return user, body["access_token"]
+        with ThreadPoolExecutor(8) as pool:
+            self.tokens.update(pool.map(sign_up, users))
+
+        for room, room_members in members.items():
+            owner = owners.get(room, room_members[0])
+            status, body, _ = self.request("POST", "/create_room", {"name": f"replay_{room}", "api_key": "replay-key"}, owner)
+            self.rooms[room] = body["room_code"]
+            for user in room_members:
+                if user != owner:
+                    self.request("POST", f"/rooms/{body['room_code']}/join", user=user)
+        print(f"Set up {len(self.tokens)} users and {len(self.rooms)} rooms")
+
+    # Replay
+
+    def http_call(self, e):
+        """Translate a recorded request into (method, path, body), or None if it can't be replayed."""
+        route, room, user = e.get("route"), e.get("room"), e.get("user")
+        if route is None:
+            return None
+        if "{room_code}" in route:
+            if room not in self.rooms:
+                return None
+            route = route.replace("{room_code}", self.rooms[room])
+        if "{message_id}" in route:
+            if e.get("msg") not in self.messages:
+                return None
+            route = route.replace("{message_id}", str(self.messages[e["msg"]]))
+        body = None
+        if route == "/auth/signup":
+            body = {"username": self.unique("replay_signup"), "password": PASSWORD}
+        elif route == "/auth/login":
+            username = f"replay_{user}" if user else f"replay_{next(iter(self.tokens), '')}"
+            body = {"username": username, "password": PASSWORD}
+        elif route == "/create_room":
+            body = {"name": self.unique("replay_room"), "api_key": "replay-key"}
+        elif route.endswith("/send_message"):
+            content = "x" * e.get("chars", 20)
+            if e.get("command"):
+                reply = self.reply_chars.get(e.get("msg"))
+                marker = f"@bot replay:{reply} " if reply is not None else "@bot "
+                content = marker + content[len(marker):]
+            body = {"content": content}
+        elif route.endswith("/read"):
+            body = {}
+        elif e["method"] == "POST" and e.get("req_bytes"):
+            return None
+        return e["method"], route, body
+
+    async def replay_http(self, e):
+        call = self.http_call(e)
+        if call is None:
+            self.skipped[f"{e['method']} {e.get('route')}"] += 1
+            return
+        method, path, body = call
+        status, payload, ms = await asyncio.to_thread(self.request, method, path, body, e.get("user"))
+        key = f"{e['method']} {e['route']}"
+        self.samples[key].append(ms)
+        self.statuses[key][status] += 1
+        if path.endswith("/send_message") and status == 200 and payload and e.get("msg"):
+            self.messages[e["msg"]] = payload["message_id"]
+
+    async def replay_ws(self, e):
+        from websockets.asyncio.client import connect
+        room, user = e.get("room"), e.get("user")
+        if room not in self.rooms or user not in self.tokens:
+            self.skipped["ws"] += 1
+            return
+        url = f"{self.ws_url}/ws/room/{self.rooms[room]}?token={self.tokens[user]}"
+        started = time.perf_counter()
+        try:
+            async with connect(url) as websocket:
+                await websocket.recv()  # welcome
+                self.samples["ws connect"].append((time.perf_counter() - started) * 1000)
+                self.statuses["ws connect"]["ok"] += 1
+                end = time.monotonic() + e.get("duration_s", 0) / self.speed
+                while (remaining := end - time.monotonic()) > 0:
+                    try:
+                        await asyncio.wait_for(websocket.recv(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+        except Exception as exc:
+            self.statuses["ws connect"][type(exc).__name__] += 1
+
+    async def run(self):
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(64))
+        tasks = []
+        started = time.monotonic()
+        for e in self.events:
+            if e["kind"] not in ("http", "ws"):
+                continue
+            # Fire late events right away: falling behind is load, not something to smooth over
+            delay = started + (e.get("t") or 0) / self.speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            replay = self.replay_http(e) if e["kind"] == "http" else self.replay_ws(e)
+            tasks.append(asyncio.create_task(replay))
+        await asyncio.gather(*tasks)
+        return time.monotonic() - started
+
+
+def wait_for_bot_jobs(timeout=120):
+    from llm.llm_queue import active_jobs, job_queue
+    deadline = time.monotonic() + timeout
+    while (active_jobs or not job_queue.empty()) and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+
+def compare(results, baseline, tolerance, min_delta_ms, min_samples):
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None or min(current["count"], base["count"]) < min_samples:
+            continue
+        for p in PERCENTILES:
+            now, before = current[f"p{p}"], base[f"p{p}"]
+            if now > before * (1 + tolerance) and now - before > min_delta_ms:
+                regressions.append(f"{key} p{p}: {before:.1f} -> {now:.1f} ms")
+    return regressions
+
+
+def print_results(results, statuses):
+    print(f"{'':40} {'count':>6} " + " ".join(f"{f'p{p}':>9}" for p in PERCENTILES) + "  statuses")
+    for key, row in results.items():
+        status_text = ", ".join(f"{status}: {n}" for status, n in sorted(statuses.get(key, {}).items(), key=str))
+        print(f"{key:40} {row['count']:>6} " + " ".join(f"{row[f'p{p}']:>9.1f}" for p in PERCENTILES) + f"  {status_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="trace recorded with TRAFFIC_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay N times faster than recorded (default 1)")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="write this run's results as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (default 0.25)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore slowdowns smaller than this (default 5)")
+    parser.add_argument("--min-samples", type=int, default=10, help="skip keys with fewer samples (default 10)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="client timeout per request in seconds (default 30)")
+    parser.add_argument("--no-rate-limits", action="store_true", help="lift rate limits, e.g. for replays well above 1x")
+    args = parser.parse_args()
+
+    events = load_trace(args.trace)
+    print(f"Loaded {len(events)} events spanning {events[-1]['t'] if events else 0:.1f}s")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # Must be set before the app (and app.db) is imported
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'replay.db')}"
+        os.environ.pop("TRAFFIC_RECORD_PATH", None)
+        migrate()
+
+        import main as app_main
+        from app.utils import traffic
+        from app.utils.rate_limit import LIMITERS
+        from llm import model_router
+
+        model_router.set_stream_factory(fake_llm_for(events, args.speed))
+        if args.no_rate_limits:
+            for limiter in LIMITERS:
+                limiter.rate = limiter.burst = 1e9
+
+        server, thread, port = start_server(app_main.app)
+        replayer = Replayer(events, port, args.speed, args.timeout)
+        replayer.set_up()
+
+        # Record the replay itself for server-side bot job timings
+        server_trace = os.path.join(scratch, "replay_trace.jsonl")
+        traffic.start_recording(server_trace)
+        elapsed = asyncio.run(replayer.run())
+        wait_for_bot_jobs()
+        traffic.stop_recording()
+        server.should_exit = True
+        thread.join(timeout=10)
+
+        for e in load_trace(server_trace):
+            if e["kind"] == "bot_job":
+                for field in ("queue_ms", "first_token_ms", "ms"):
+                    if e.get(field) is not None:
+                        replayer.samples[f"bot_job {field}"].append(e[field])
+                replayer.statuses["bot_job ms"][e.get("cancelled") or ("error" if e.get("error") else "ok")] += 1
+
+    results = summarize(replayer.samples)
+    print(f"\nReplayed in {elapsed:.1f}s at {args.speed}x\n")
+    print_results(results, replayer.statuses)
+    if replayer.skipped:
+        print("\nSkipped: " + ", ".join(f"{key} x{n}" for key, n in replayer.skipped.items()))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"trace": os.path.basename(args.trace), "speed": args.speed, "results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("speed") != args.speed:
+            print(f"\nWarning: baseline was recorded at {baseline.get('speed')}x, this run is {args.speed}x")
+        regressions = compare(results, baseline["results"], args.tolerance, args.min_delta_ms, args.min_samples)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Run from anywhere: the app imports its packages relative to the backend directory
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Keep app.db away from the development database
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+
+
+@pytest.fixture(scope="session")
+def migrated_db():
+    """The test database, upgraded to the latest Alembic revision."""
+    from alembic import command
+    from alembic.config import Config
+    config = Config()
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    config.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"])
+    command.upgrade(config, "head")
+    return os.environ["DATABASE_URL"]
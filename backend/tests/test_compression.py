@@ -0,0 +1,123 @@
+import asyncio
+import base64
+import json
+import os
+import zlib
+import pytest
+from app.utils import compression
+from app.utils.compression import (
+    MESSAGE_COMPRESS_MIN_BYTES, WS_COMPRESS_MIN_BYTES, Frame, compress_content, decompress_content,
+    decompress_prefix, send_frame,
+)
+from app.models.messages import Message
+# Message's relationships need the other models registered
+import app.models.user, app.models.rooms, app.models.user_room, app.models.room_usage  # noqa: F401,E401
+
+LONG_TEXT = "The quick brown fox jumps over the lazy dog, naïvely. " * 100
+
+
+def test_round_trip():
+    content, codec, blob = compress_content(LONG_TEXT)
+
+    assert (content, codec) == ("", "zlib")
+    assert len(blob) < len(LONG_TEXT.encode("utf-8"))
+    assert decompress_content(codec, blob) == LONG_TEXT
+
+
+def test_short_text_stays_plain():
+    text = "x" * (MESSAGE_COMPRESS_MIN_BYTES - 1)
+    assert compress_content(text) == (text, None, None)
+
+
+def test_threshold_counts_utf8_bytes():
+    # Fewer characters than the threshold, but more bytes
+    text = "é" * (MESSAGE_COMPRESS_MIN_BYTES // 2 + 1)
+    assert compress_content(text)[1] == "zlib"
+
+
+def test_poorly_compressible_text_stays_plain(monkeypatch):
+    # Random base64 only shrinks by about a quarter
+    text = base64.b64encode(os.urandom(MESSAGE_COMPRESS_MIN_BYTES * 2)).decode()
+    assert compress_content(text)[1] == "zlib"
+
+    monkeypatch.setattr(compression, "MIN_SAVINGS", 0.5)
+    assert compress_content(text) == (text, None, None)
+
+
+def test_prefix_inflates_only_what_it_needs():
+    _, codec, blob = compress_content(LONG_TEXT)
+
+    assert decompress_prefix(codec, blob, 50) == LONG_TEXT[:50]
+    assert decompress_prefix(codec, blob, len(LONG_TEXT) + 10) == LONG_TEXT
+
+
+def test_prefix_drops_a_character_cut_in_half():
+    text = "€" * 2000
+    _, codec, blob = compress_content(text)
+
+    prefix = decompress_prefix(codec, blob, 10)
+    assert prefix == "€" * 10
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        decompress_content("brotli", b"")
+    with pytest.raises(ValueError):
+        decompress_prefix("brotli", b"", 10)
+
+
+def test_message_content_property_round_trip():
+    message = Message(content=LONG_TEXT)
+
+    assert message._content == "" and message.content_codec == "zlib"
+    assert message.content == LONG_TEXT
+    assert message.content_preview(20) == LONG_TEXT[:20]
+
+    message.content = "short"
+    assert (message._content, message.content_codec, message.content_blob) == ("short", None, None)
+    assert message.content == "short"
+    assert message.content_preview(3) == "sho"
+
+
+def test_content_values_match_the_property():
+    values = Message.content_values(LONG_TEXT)
+
+    assert values[Message._content] == ""
+    assert decompress_content(values[Message.content_codec], values[Message.content_blob]) == LONG_TEXT
+
+
+def test_frame_matches_send_json_and_compresses_once():
+    message = {"type": "bot_message_delta", "content": "héllo " * 10}
+    frame = Frame(message)
+
+    assert json.loads(frame.text) == message
+    assert zlib.decompress(frame.compressed()).decode("utf-8") == frame.text
+    assert frame.compressed() is frame.compressed()
+
+
+class FakeWebSocket:
+    def __init__(self, compress):
+        self.query_params = {"compress": "zlib"} if compress else {}
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+
+@pytest.mark.parametrize("compress, size, binary", [
+    (True, WS_COMPRESS_MIN_BYTES, True),
+    (True, 10, False),
+    (False, WS_COMPRESS_MIN_BYTES, False),
+])
+def test_send_frame_compresses_large_frames_for_opted_in_clients(compress, size, binary):
+    websocket = FakeWebSocket(compress)
+    message = {"content": "a" * size}
+
+    asyncio.run(send_frame(websocket, message))
+
+    sent = websocket.sent[0]
+    assert isinstance(sent, bytes) == binary
+    assert json.loads(zlib.decompress(sent) if binary else sent) == message
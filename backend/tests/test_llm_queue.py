@@ -0,0 +1,190 @@
+import asyncio
+import json
+import uuid
+from collections import defaultdict
+import pytest
+from app.db import SessionLocal
+from app.models.user import User
+from app.models.rooms import Room
+from app.models.user_room import UserRoom
+from app.models.messages import Message
+from app.routes.msg_socket import active_connections
+from llm import llm_queue, model_router
+from llm.fake_llm import FakeLLM
+from llm.inflight import inflight_generations
+
+# Long enough that the reply is still streaming when the test steps in
+SLOW_REPLY = dict(reply_chars=2000, chunk_chars=20, first_token_delay=0, chunk_delay=0.02)
+
+
+class RecordingSocket:
+    """Stands in for a subscribed websocket and keeps every event sent to it."""
+    query_params = {}
+
+    def __init__(self):
+        self.events = []
+
+    async def send_text(self, text):
+        self.events.append(json.loads(text))
+
+    def of_type(self, event_type):
+        return [e for e in self.events if e.get("type") == event_type]
+
+
+@pytest.fixture
+def bot_room(migrated_db, monkeypatch):
+    """A room with a pending @bot command; yields (room_id, command message id)."""
+    # The queue and locks bind to the event loop that first uses them: give each test its own
+    monkeypatch.setattr(llm_queue, "job_queue", asyncio.Queue())
+    monkeypatch.setattr(llm_queue, "room_locks", defaultdict(asyncio.Lock))
+    monkeypatch.setattr(llm_queue, "CANCEL_WHEN_UNSUBSCRIBED", False)
+
+    db = SessionLocal()
+    try:
+        user = User(username=f"asker_{uuid.uuid4().hex[:8]}", hashed_password="x")
+        db.add(user)
+        db.flush()
+        room = Room(name=f"room_{uuid.uuid4().hex[:8]}", code=uuid.uuid4().hex[:8], owner_id=user.id, api_key="key")
+        db.add(room)
+        db.flush()
+        db.add(UserRoom(user_id=user.id, room_id=room.id))
+        command = Message(room_id=room.id, user_id=user.id, content="@bot tell me a story", message_type="command")
+        db.add(command)
+        db.commit()
+        yield room.id, command.id
+    finally:
+        db.close()
+        model_router.set_stream_factory(None)
+        active_connections.pop(room.id, None)
+
+
+def load_messages(room_id, command_id):
+    db = SessionLocal()
+    try:
+        command = db.query(Message).filter_by(id=command_id).one()
+        replies = db.query(Message).filter_by(room_id=room_id, message_type="bot").all()
+        return command.processed, [(reply.content, reply.processed) for reply in replies]
+    finally:
+        db.close()
+
+
+async def wait_for(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met in time")
+
+
+def test_worker_shutdown_propagates_and_saves_partial_reply(bot_room):
+    room_id, command_id = bot_room
+    model_router.set_stream_factory(FakeLLM(**SLOW_REPLY))
+
+    async def run():
+        worker = asyncio.create_task(llm_queue.worker_loop(0))
+        await llm_queue.enqueue_bot_job(room_id, command_id, "@bot tell me a story", "key")
+        await wait_for(lambda: inflight_generations.get(room_id, {}).get(command_id) is not None
+                       and inflight_generations[room_id][command_id].length > 0)
+        worker.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(worker, 2)
+        return worker
+
+    worker = asyncio.run(run())
+
+    assert worker.cancelled()
+    assert command_id not in llm_queue.active_jobs
+    assert command_id not in inflight_generations.get(room_id, {})
+    processed, replies = load_messages(room_id, command_id)
+    assert processed
+    assert len(replies) == 1 and 0 < len(replies[0][0]) < 2000 and replies[0][1]
+
+
+def test_deadline_cancels_the_job_but_not_the_worker(bot_room, monkeypatch):
+    room_id, command_id = bot_room
+    monkeypatch.setattr(llm_queue, "JOB_DEADLINE_SECONDS", 0.2)
+    model_router.set_stream_factory(FakeLLM(**SLOW_REPLY))
+    socket = RecordingSocket()
+    active_connections[room_id] = [socket]
+
+    async def run():
+        worker = asyncio.create_task(llm_queue.worker_loop(0))
+        await llm_queue.enqueue_bot_job(room_id, command_id, "@bot tell me a story", "key")
+        await wait_for(lambda: socket.of_type("bot_message_end"))
+        await wait_for(lambda: command_id not in llm_queue.active_jobs)
+        still_running = not worker.done()
+        worker.cancel()
+        return still_running
+
+    assert asyncio.run(run())
+    end = socket.of_type("bot_message_end")[0]
+    assert end["cancelled"] == "deadline"
+    processed, replies = load_messages(room_id, command_id)
+    assert processed
+    assert len(replies) == 1 and 0 < len(replies[0][0]) < 2000
+
+
+def test_job_expired_in_queue_is_not_generated(bot_room, monkeypatch):
+    room_id, command_id = bot_room
+    monkeypatch.setattr(llm_queue, "JOB_DEADLINE_SECONDS", 0)
+    fake = FakeLLM(**SLOW_REPLY)
+    model_router.set_stream_factory(fake)
+    socket = RecordingSocket()
+    active_connections[room_id] = [socket]
+
+    async def run():
+        await llm_queue.enqueue_bot_job(room_id, command_id, "@bot tell me a story", "key")
+        worker = asyncio.create_task(llm_queue.worker_loop(0))
+        await wait_for(lambda: socket.of_type("bot_message_cancelled"))
+        worker.cancel()
+
+    asyncio.run(run())
+    assert socket.of_type("bot_message_cancelled")[0]["reason"] == "deadline"
+    assert fake.calls == 0
+    assert load_messages(room_id, command_id) == (True, [])
+
+
+def test_requester_can_cancel_through_the_api(migrated_db, monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setattr(llm_queue, "job_queue", asyncio.Queue())
+    monkeypatch.setattr(llm_queue, "room_locks", defaultdict(asyncio.Lock))
+    monkeypatch.setattr(llm_queue, "CANCEL_WHEN_UNSUBSCRIBED", False)
+    model_router.set_stream_factory(FakeLLM(**SLOW_REPLY))
+    suffix = uuid.uuid4().hex[:8]
+
+    def auth(token):
+        return {"Authorization": f"Bearer {token}"}
+
+    try:
+        with TestClient(main.app) as client:
+            asker = client.post("/auth/signup", json={"username": f"asker_{suffix}", "password": "pw"}).json()["access_token"]
+            other = client.post("/auth/signup", json={"username": f"other_{suffix}", "password": "pw"}).json()["access_token"]
+            code = client.post("/create_room", json={"name": f"cancel_{suffix}", "api_key": "key"}, headers=auth(other)).json()["room_code"]
+            client.post(f"/rooms/{code}/join", headers=auth(asker))
+            client.post(f"/rooms/{code}/join", headers=auth(other))
+            stranger = client.post("/auth/signup", json={"username": f"stranger_{suffix}", "password": "pw"}).json()["access_token"]
+            # A member who is neither the asker nor the owner
+            bystander = client.post("/auth/signup", json={"username": f"bystander_{suffix}", "password": "pw"}).json()["access_token"]
+            client.post(f"/rooms/{code}/join", headers=auth(bystander))
+
+            with client.websocket_connect(f"/ws/room/{code}?token={asker}") as websocket:
+                websocket.receive_json()  # welcome
+                command_id = client.post(
+                    f"/room/{code}/send_message", json={"content": "@bot tell me a story"}, headers=auth(asker)
+                ).json()["message_id"]
+
+                assert client.post(f"/room/{code}/bot/{command_id + 1000}/cancel", headers=auth(asker)).status_code == 404
+                assert client.post(f"/room/{code}/bot/{command_id}/cancel", headers=auth(stranger)).status_code == 403
+                assert client.post(f"/room/{code}/bot/{command_id}/cancel", headers=auth(bystander)).status_code == 403
+                response = client.post(f"/room/{code}/bot/{command_id}/cancel", headers=auth(asker))
+                assert response.status_code == 200 and response.json() == {"message_id": command_id, "cancelled": True}
+
+                for _ in range(1000):
+                    event = websocket.receive_json()
+                    if event.get("type") in ("bot_message_end", "bot_message_cancelled"):
+                        break
+                assert event.get("cancelled", event.get("reason")) == "requested"
+    finally:
+        model_router.set_stream_factory(None)
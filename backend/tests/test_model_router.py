@@ -0,0 +1,142 @@
+import asyncio
+import pytest
+from llm import model_router
+from llm.fake_llm import FakeLLM
+from llm.model_router import ModelEndpoint, route_stream
+
+PRIMARY = ModelEndpoint("primary", "model-a", "http://primary")
+SECONDARY = ModelEndpoint("secondary", "model-b", "http://secondary")
+
+
+class Upstream:
+    """Stream factory that answers each endpoint with its own FakeLLM, or fails it."""
+    def __init__(self, **by_name):
+        self.by_name = by_name
+        self.closed = []
+
+    def __call__(self, endpoint, prompt, api_key, max_tokens):
+        behaviour = self.by_name[endpoint.name]
+        if isinstance(behaviour, Exception):
+            return self._fail(behaviour)
+        return self._track(endpoint, behaviour(endpoint, prompt, api_key, max_tokens))
+
+    async def _fail(self, error):
+        raise error
+        yield
+
+    async def _track(self, endpoint, stream):
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            self.closed.append(endpoint.name)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    def install(**by_name):
+        factory = Upstream(**by_name)
+        model_router.set_stream_factory(factory)
+        return factory
+    monkeypatch.setattr(model_router, "HEDGE_DELAY_SECONDS", 0.05)
+    monkeypatch.setattr(model_router, "HEDGING_ENABLED", False)
+    yield install
+    model_router.set_stream_factory(None)
+
+
+def collect(route_info=None, endpoints=(PRIMARY, SECONDARY)):
+    async def run():
+        return "".join([chunk async for chunk in route_stream(
+            "hello", "key", endpoints=list(endpoints), route_info=route_info
+        )])
+    return asyncio.run(run())
+
+
+def fast(**kwargs):
+    return FakeLLM(reply_chars=60, first_token_delay=0, chunk_delay=0, **kwargs)
+
+
+def slow():
+    return FakeLLM(reply_chars=60, first_token_delay=1.0, chunk_delay=0)
+
+
+def test_primary_answers_without_hedging(upstream):
+    primary, secondary = fast(), fast()
+    upstream(primary=primary, secondary=secondary)
+    route_info = {}
+
+    reply = collect(route_info)
+
+    assert reply.startswith("[primary]") and len(reply) == 60
+    assert route_info["endpoint"] == "primary" and route_info["attempts"] == 1
+    assert secondary.calls == 0
+
+
+def test_slow_primary_is_hedged_and_cancelled(upstream, monkeypatch):
+    monkeypatch.setattr(model_router, "HEDGING_ENABLED", True)
+    factory = upstream(primary=slow(), secondary=fast())
+    route_info = {}
+
+    reply = collect(route_info)
+
+    assert reply.startswith("[secondary]")
+    assert route_info["endpoint"] == "secondary" and route_info["attempts"] == 2
+    # The losing request is closed as soon as the hedge wins
+    assert factory.closed[0] == "primary"
+
+
+def test_slow_primary_is_awaited_when_hedging_is_off(upstream):
+    secondary = fast()
+    upstream(primary=FakeLLM(reply_chars=60, first_token_delay=0.1, chunk_delay=0), secondary=secondary)
+
+    assert collect().startswith("[primary]")
+    assert secondary.calls == 0
+
+
+def test_falls_back_when_primary_fails_before_first_token(upstream):
+    upstream(primary=ConnectionError("primary down"), secondary=fast())
+    route_info = {}
+
+    assert collect(route_info).startswith("[secondary]")
+    assert route_info["attempts"] == 2
+
+
+def test_raises_last_error_when_every_endpoint_fails(upstream):
+    upstream(primary=ConnectionError("primary down"), secondary=TimeoutError("secondary timed out"))
+    route_info = {}
+
+    with pytest.raises(TimeoutError):
+        collect(route_info)
+    assert route_info["attempts"] == 2
+
+
+def test_empty_reply_is_an_answer(upstream):
+    secondary = fast()
+    upstream(primary=FakeLLM(reply_chars=0, first_token_delay=0), secondary=secondary)
+
+    assert collect() == ""
+    assert secondary.calls == 0
+
+
+def test_cancelling_the_consumer_closes_every_attempt(upstream, monkeypatch):
+    monkeypatch.setattr(model_router, "HEDGING_ENABLED", True)
+    factory = upstream(primary=slow(), secondary=slow())
+
+    async def run():
+        task = asyncio.ensure_future(collect_async())
+        await asyncio.sleep(0.2)  # both requests are in flight by now
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    async def collect_async():
+        return [chunk async for chunk in route_stream("hello", "key", endpoints=[PRIMARY, SECONDARY])]
+
+    asyncio.run(run())
+    assert sorted(factory.closed) == ["primary", "secondary"]
+
+
+def test_no_endpoints(upstream):
+    upstream()
+    with pytest.raises(RuntimeError):
+        collect(endpoints=())
@@ -0,0 +1,67 @@
+import uuid
+from app.db import SessionLocal
+from app.models.rooms import Room
+from app.models.messages import Message
+from app.utils.bot_utils import get_or_create_bot_user
+from llm.inflight import start_generation, finish_generation
+
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def receive_until(websocket, text, limit=100):
+    """Messages broadcast by the poller, up to and including the one with this text."""
+    received = []
+    for _ in range(limit):
+        event = websocket.receive_json()
+        if "message" in event:
+            received.append(event["message"])
+            if event["message"] == text:
+                return received
+    raise AssertionError(f"{text!r} never arrived")
+
+
+def test_reply_finished_after_newer_messages_still_reaches_sockets(migrated_db):
+    from fastapi.testclient import TestClient
+    import main
+
+    suffix = uuid.uuid4().hex[:8]
+    with TestClient(main.app) as client:
+        token = client.post("/auth/signup", json={"username": f"poller_{suffix}", "password": "pw"}).json()["access_token"]
+        code = client.post("/create_room", json={"name": f"poller_{suffix}", "api_key": "key"}, headers=auth(token)).json()["room_code"]
+
+        with client.websocket_connect(f"/ws/room/{code}?token={token}") as websocket:
+            websocket.receive_json()  # welcome
+
+            # A long bot reply checkpointed part-way through, as llm_queue.save_bot_message does
+            db = SessionLocal()
+            try:
+                room = db.query(Room).filter_by(code=code).one()
+                reply = Message(room_id=room.id, user_id=get_or_create_bot_user(db), content="partial reply",
+                                message_type="bot", processed=False)
+                db.add(reply)
+                db.flush()
+                generation = start_generation(room.id, reply.id)
+                generation.bot_message_id = reply.id
+                db.commit()
+
+                client.post(f"/room/{code}/send_message", json={"content": "meanwhile"}, headers=auth(token))
+                assert receive_until(websocket, "meanwhile") == ["meanwhile"]
+
+                messages = client.get(f"/room/{code}/messages", headers=auth(token)).json()["messages"]
+                assert [(m["content"], m["generating"]) for m in messages] == [("partial reply", True), ("meanwhile", False)]
+
+                # The reply finishes after the poller has moved past "meanwhile"
+                reply.content = "full reply"
+                reply.processed = True
+                db.commit()
+                finish_generation(room.id, reply.id)
+            finally:
+                db.close()
+
+            client.post(f"/room/{code}/send_message", json={"content": "after"}, headers=auth(token))
+            received = receive_until(websocket, "after")
+
+    # Delivered once it's finished, and nothing is sent twice
+    assert received == ["full reply", "after"]
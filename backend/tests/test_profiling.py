@@ -0,0 +1,40 @@
+import time
+import pytest
+from app.utils import profiling
+from app.utils.profiling import profile_request, stage
+
+
+@pytest.fixture
+def dumped(monkeypatch):
+    dumped = []
+    monkeypatch.setattr(profiling, "dump_profile_in_background", dumped.append)
+    monkeypatch.setattr(profiling, "PROFILE_SLOW_MS", 20)
+    return dumped
+
+
+def test_requests_over_the_threshold_are_dumped(dumped):
+    with profile_request("fast", force=True):
+        pass
+    with profile_request("slow", force=True):
+        with stage("db"):
+            time.sleep(0.03)
+
+    assert [profile.name for profile in dumped] == ["slow"]
+    assert dumped[0].stages["db"] >= 0.03
+
+
+def test_jobs_use_their_own_threshold(dumped):
+    with profile_request("bot_job", force=True, slow_ms=1000):
+        time.sleep(0.03)
+    assert dumped == []
+
+    with profile_request("bot_job", force=True, slow_ms=10):
+        time.sleep(0.03)
+    assert len(dumped) == 1
+
+
+def test_unsampled_requests_are_not_profiled(dumped, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0)
+    with profile_request("off") as profile:
+        time.sleep(0.03)
+    assert profile is None and dumped == []
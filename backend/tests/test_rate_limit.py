@@ -0,0 +1,119 @@
+import pytest
+from fastapi import HTTPException
+from app.utils import rate_limit
+from app.utils.rate_limit import RateLimiter, acquire, enforce
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_then_reject(clock):
+    limiter = RateLimiter("test", rate=1, burst=3)
+
+    assert [acquire((limiter, "u")) for _ in range(3)] == [None, None, None]
+    denied = acquire((limiter, "u"))
+
+    assert denied is not None
+    assert denied[0] is limiter and denied[1] == pytest.approx(1.0)
+    assert (limiter.allowed, limiter.rejected) == (3, 1)
+
+
+def test_keys_have_separate_buckets(clock):
+    limiter = RateLimiter("test", rate=1, burst=1)
+
+    assert acquire((limiter, "a")) is None
+    assert acquire((limiter, "b")) is None
+    assert acquire((limiter, "a")) is not None
+
+
+def test_refills_at_rate_up_to_burst(clock):
+    limiter = RateLimiter("test", rate=2, burst=4)
+    for _ in range(4):
+        acquire((limiter, "u"))
+
+    clock.now += 0.5  # one token back
+    assert acquire((limiter, "u")) is None
+    assert acquire((limiter, "u")) is not None
+
+    clock.now += 60  # idle for long: capped at burst, not 120 tokens
+    assert [acquire((limiter, "u")) for _ in range(4)] == [None] * 4
+    assert acquire((limiter, "u")) is not None
+
+
+def test_cost_and_retry_wait(clock):
+    limiter = RateLimiter("test", rate=0.5, burst=2)
+
+    assert acquire((limiter, "u"), cost=2) is None
+    limiter_denied, wait = acquire((limiter, "u"), cost=1)
+
+    assert limiter_denied is limiter and wait == pytest.approx(2.0)
+
+
+def test_all_or_nothing_across_limiters(clock):
+    user = RateLimiter("user", rate=1, burst=5)
+    room = RateLimiter("room", rate=1, burst=1)
+    acquire((room, "r"))
+
+    denied = acquire((user, "u"), (room, "r"))
+
+    assert denied[0] is room
+    # The user bucket was not charged for the rejected request
+    assert user.buckets["u"][0] == 5
+    assert user.allowed == 0
+
+
+def test_idle_full_buckets_are_evicted_first(clock):
+    limiter = RateLimiter("test", rate=1, burst=2, max_buckets=100)
+    acquire((limiter, "idle"))
+    clock.now += 10  # refilled completely
+
+    acquire((limiter, "active"))
+
+    assert list(limiter.buckets) == ["active"]
+    assert limiter.evicted == 1
+
+
+def test_max_buckets_drops_least_recently_used(clock):
+    limiter = RateLimiter("test", rate=1, burst=10, max_buckets=2)
+    for key in ("a", "b"):
+        acquire((limiter, key))
+    acquire((limiter, "a"))  # "b" is now least recently used
+
+    acquire((limiter, "c"))
+
+    assert list(limiter.buckets) == ["a", "c"]
+    assert limiter.stats()["buckets"] == 2
+
+
+def test_enforce_raises_429_with_retry_after(clock):
+    limiter = RateLimiter("user_send", rate=0.25, burst=1)
+    enforce((limiter, "u"))
+
+    with pytest.raises(HTTPException) as excinfo:
+        enforce((limiter, "u"))
+
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "4"
+    assert "user_send" in excinfo.value.detail
+
+
+def test_retry_after_is_at_least_one_second(clock):
+    limiter = RateLimiter("fast", rate=100, burst=1)
+    enforce((limiter, "u"))
+
+    with pytest.raises(HTTPException) as excinfo:
+        enforce((limiter, "u"))
+
+    assert excinfo.value.headers["Retry-After"] == "1"
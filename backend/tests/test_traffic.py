@@ -0,0 +1,22 @@
+import gzip
+import json
+from app.utils import traffic
+from app.utils.traffic import TrafficRecorder
+
+
+def test_batches_are_written_in_order_and_flush_waits_for_them(tmp_path, monkeypatch):
+    monkeypatch.setattr(traffic, "TRAFFIC_FLUSH_EVERY", 10)
+    path = str(tmp_path / "trace.jsonl.gz")
+    recorder = TrafficRecorder(path, salt=b"salt")
+
+    for i in range(45):
+        recorder.record("http", seq=i, user=7, room="abc")
+    recorder.close()
+
+    with gzip.open(path, "rt") as f:
+        events = [json.loads(line) for line in f]
+    assert events[0]["kind"] == "header"
+    assert [e["seq"] for e in events[1:]] == list(range(45))
+    # Identifiers are hashed, and differently per field
+    assert events[1]["user"] == recorder.anonymize("user", 7) != recorder.anonymize("room", 7)
+    assert "abc" not in json.dumps(events)